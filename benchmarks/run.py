@@ -0,0 +1,205 @@
+# benchmarks/run.py
+"""
+Time and memory-profile the analyzers and the /upload-csv/ ingest on a synthetic star schema.
+
+    python -m benchmarks.run --rows 200000 --dimensions 4 --output before.json
+    python -m benchmarks.run --rows 200000 --dimensions 4 --compare before.json
+
+Everything runs in a scratch directory, so database.db and the columnar copies of the
+checkout are never touched. Peak memory is what tracemalloc sees in this process;
+work handed to worker processes (large ml_combined_correlation runs) is not included.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+import pandas as pd
+from fastapi import UploadFile
+from benchmarks.star_schema import star_schema
+from database import upload_csv
+from models.correlation import combined_correlation, ml_combined_correlation
+from models.data_quality import data_quality
+from models.fact_dimensions import detect_fact_dimension
+from models.granularity import analyze_granularity
+from models.primary_foreign_keys import extract_pk_fk_relationships
+from utils.db import get_pool
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "benchmarks", "results")
+REGRESSION_THRESHOLD = 1.2  # slowdown or memory growth ratio reported as a regression
+
+
+def git_revision():
+    """Commit of the checkout being measured and whether it has uncommitted changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def measure(fn, repeat):
+    """Wall time of `repeat` plain runs, then one extra run under tracemalloc for the peak"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "runs": repeat,
+        "seconds_min": round(min(timings), 6),
+        "seconds_median": round(statistics.median(timings), 6),
+        "peak_memory_bytes": peak,
+    }
+
+
+def upload(contents):
+    files = [UploadFile(io.BytesIO(content), filename=name) for name, content in contents.items()]
+    return upload_csv(files, mode="replace")
+
+
+def benchmarks(tables, contents, ml_max_rows=None):
+    """{name: zero-argument callable}; the data-quality variants need the ingest to have run first"""
+    fact = tables["fact"]
+    dimension = tables["dim0"] if "dim0" in tables else fact
+    names = list(tables)
+    return {
+        "upload_csv": lambda: upload(contents),
+        "extract_pk_fk_relationships": lambda: extract_pk_fk_relationships(tables),
+        "detect_fact_dimension": lambda: detect_fact_dimension(tables),
+        "data_quality": lambda: data_quality(names, use_cache=False),
+        "data_quality_scan": lambda: data_quality(names, use_cache=False, rescan=True),
+        "data_quality_pushdown": lambda: data_quality(names, use_cache=False, pushdown=True),
+        "combined_correlation": lambda: combined_correlation(fact, dimension),
+        "ml_combined_correlation": lambda: ml_combined_correlation(fact, dimension, max_rows=ml_max_rows),
+        "analyze_granularity": lambda: analyze_granularity(fact),
+    }
+
+
+def run(args):
+    commit, dirty = git_revision()
+    generated = star_schema(args.rows, args.columns, args.cardinality, args.null_rate, args.dimensions, args.seed)
+    contents = {f"{name}.csv": df.to_csv(index=False).encode() for name, df in generated.items()}
+    # Analyzers get the frames the upload endpoints would parse, not the generator's dtypes
+    tables = {name[:-len(".csv")]: pd.read_csv(io.BytesIO(content)) for name, content in contents.items()}
+
+    selected = benchmarks(tables, contents, args.ml_max_rows)
+    unknown = set(args.only or []) - set(selected)
+    if unknown:
+        raise SystemExit(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    results = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="rbasic-bench-") as scratch:
+        os.chdir(scratch)
+        try:
+            upload(contents)  # data_quality reads the ingested tables
+            for name, fn in selected.items():
+                if args.only and name not in args.only or name in (args.skip or []):
+                    continue
+                print(f"{name} ...", end=" ", flush=True, file=sys.stderr)
+                results[name] = measure(fn, args.repeat)
+                print(f"{results[name]['seconds_min']:.3f}s", file=sys.stderr)
+        finally:
+            get_pool().close()
+            os.chdir(cwd)
+
+    return {
+        "commit": commit,
+        "dirty": dirty,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "rows": args.rows,
+            "columns": args.columns,
+            "cardinality": args.cardinality,
+            "null_rate": args.null_rate,
+            "dimensions": args.dimensions,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "ml_max_rows": args.ml_max_rows,
+        },
+        "tables": {name: {"rows": len(df), "columns": len(df.columns), "csv_bytes": len(contents[f"{name}.csv"])} for name, df in tables.items()},
+        "benchmarks": results,
+    }
+
+
+def compare(baseline, current, threshold=REGRESSION_THRESHOLD):
+    """Time and memory ratios (current / baseline) per benchmark present in both reports"""
+    if baseline.get("config") != current.get("config"):
+        print("warning: the reports were produced with different configurations", file=sys.stderr)
+    changes = {}
+    for name, result in current["benchmarks"].items():
+        before = baseline["benchmarks"].get(name)
+        if before is None:
+            continue
+        time_ratio = result["seconds_min"] / before["seconds_min"] if before["seconds_min"] else None
+        memory_ratio = result["peak_memory_bytes"] / before["peak_memory_bytes"] if before["peak_memory_bytes"] else None
+        changes[name] = {
+            "time_ratio": round(time_ratio, 3) if time_ratio is not None else None,
+            "memory_ratio": round(memory_ratio, 3) if memory_ratio is not None else None,
+            "regression": any(ratio is not None and ratio > threshold for ratio in (time_ratio, memory_ratio)),
+        }
+    return changes
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000, help="rows in the fact table")
+    parser.add_argument("--columns", type=int, default=6, help="non-key columns per table")
+    parser.add_argument("--cardinality", type=int, default=1_000, help="rows per dimension and distinct values per attribute")
+    parser.add_argument("--null-rate", type=float, default=0.02, help="share of missing values in non-key columns")
+    parser.add_argument("--dimensions", type=int, default=3, help="number of dimension tables")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per benchmark")
+    parser.add_argument("--ml-max-rows", type=int, default=None, help="subsample passed to ml_combined_correlation")
+    parser.add_argument("--only", nargs="+", help="run just these benchmarks")
+    parser.add_argument("--skip", nargs="+", help="leave these benchmarks out")
+    parser.add_argument("--output", help=f"report path (default: {os.path.relpath(RESULTS_DIR)}/<commit>.json)")
+    parser.add_argument("--compare", help="earlier report to compare against; exits with status 1 on a regression")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="ratio counted as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{(report['commit'] or 'unknown')[:12]}{'-dirty' if report['dirty'] else ''}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            changes = compare(json.load(f), report, args.threshold)
+        print(json.dumps(changes, indent=2))
+        if any(change["regression"] for change in changes.values()):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+# benchmarks/star_schema.py
+import numpy as np
+import pandas as pd
+
+DATE_START = "2020-01-01"
+
+
+def _with_nulls(values, null_rate, rng):
+    """Blank out a random share of a column; keys are never passed through here"""
+    series = pd.Series(values)
+    if null_rate:
+        series = series.mask(rng.random(len(series)) < null_rate)
+    return series
+
+
+def _attribute(kind, rows, cardinality, rng):
+    """One non-key column: numeric measure or low-cardinality text, alternating by position"""
+    if kind % 2 == 0:
+        return rng.normal(100, 25, rows).round(2)
+    codes = rng.integers(0, cardinality, rows)
+    return np.char.add(f"value{kind}_", codes.astype(str))
+
+
+def dimension_table(index, rows, columns, cardinality, null_rate, rng):
+    """Dimension with a unique string key dim<index>_id and `columns` descriptive attributes"""
+    key = f"dim{index}_id"
+    data = {key: np.char.add(f"D{index}_", np.arange(rows).astype(str))}
+    for i in range(columns):
+        data[f"dim{index}_attr{i}"] = _with_nulls(_attribute(i + 1, rows, cardinality, rng), null_rate, rng)
+    return pd.DataFrame(data)
+
+
+def fact_table(rows, columns, dimensions, cardinality, null_rate, rng):
+    """
+    Fact with a unique fact_id, a daily order_date, one foreign key per dimension
+    (every value exists in the dimension) and `columns` measures and attributes.
+    """
+    data = {
+        "fact_id": np.char.add("F", np.arange(rows).astype(str)),
+        "order_date": (pd.Timestamp(DATE_START) + pd.to_timedelta(rng.integers(0, 3 * 365, rows), unit="D")).strftime("%Y-%m-%d"),
+    }
+    for index, dim_rows in enumerate(dimensions):
+        data[f"dim{index}_id"] = np.char.add(f"D{index}_", rng.integers(0, dim_rows, rows).astype(str))
+    for i in range(columns):
+        data[f"measure{i}"] = _with_nulls(_attribute(i, rows, cardinality, rng), null_rate, rng)
+    return pd.DataFrame(data)
+
+
+def star_schema(rows=100_000, columns=6, cardinality=1_000, null_rate=0.02, dimensions=3, seed=42):
+    """
+    Synthetic star schema as {table name: DataFrame}: one fact table with `rows` rows
+    referencing `dimensions` dimension tables of `cardinality` rows each. Every table
+    has `columns` non-key columns with up to `cardinality` distinct values and
+    `null_rate` of their values missing. The same arguments always give the same data.
+    """
+    rng = np.random.default_rng(seed)
+    dimension_rows = [cardinality] * dimensions
+    tables = {"fact": fact_table(rows, columns, dimension_rows, cardinality, null_rate, rng)}
+    for index, dim_rows in enumerate(dimension_rows):
+        tables[f"dim{index}"] = dimension_table(index, dim_rows, columns, cardinality, null_rate, rng)
+    return tables
@@ -2,80 +2,174 @@ from fastapi import FastAPI, File, UploadFile, HTTPException,Query
 import sqlite3
 import pandas as pd
 import os
+import logging
+import shutil
+import time
+from utils.helpers import quote_identifier
+from models.profile import profile_table
+from utils.cache import bump_table_version, table_versions
+from utils.columnar import write_columnar
+from utils.db import read_connection, write_connection
+from models import stats_catalog
+from utils.metrics import instrument, stage
 
 
-app = FastAPI()
-DATABASE = "database.db"
-
-def get_db_connection():
-    return sqlite3.connect(DATABASE)
-
-def create_table_from_csv(file_path: str, table_name: str, conn):
-    df = pd.read_csv(file_path)
-    cursor = conn.cursor()
-    
-    # Identify primary key (assume first column if unique)
-    primary_key = None
-    for col in df.columns:
-        if df[col].is_unique:
-            primary_key = col
-            break
-    
-    # Create table SQL statement
-    columns = []
-    for col in df.columns:
-        dtype = "TEXT"
-        if df[col].dtype == "int64":
-            dtype = "INTEGER"
-        elif df[col].dtype == "float64":
-            dtype = "REAL"
-        
-        col_def = f"{col} {dtype}"
-        if col == primary_key:
-            col_def += " PRIMARY KEY"
-        columns.append(col_def)
-    
-    create_table_sql = f"CREATE TABLE IF NOT EXISTS {table_name} ({', '.join(columns)});"
-    cursor.execute(create_table_sql)
-    
-    # Insert data
-    df.to_sql(table_name, conn, if_exists='replace', index=False)
-    conn.commit()
-    
-    return primary_key
+app = instrument(FastAPI())
+logger = logging.getLogger(__name__)
+CHUNK_SIZE = 50_000  # rows per read_csv chunk / executemany batch
+SCHEMA_SAMPLE_ROWS = 10_000  # rows read up front to infer column types
+UPLOAD_BUFFER_SIZE = 1024 * 1024  # bytes copied per read when saving an upload
+
+def sqlite_type(dtype):
+    """Map a pandas dtype to the SQLite column type used for uploaded tables"""
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return "INTEGER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "REAL"
+    return "TEXT"
+
+def infer_schema(file_path: str, sample_rows: int = SCHEMA_SAMPLE_ROWS):
+    """Infer column types from the first rows of a CSV instead of reading it whole"""
+    sample = pd.read_csv(file_path, nrows=sample_rows)
+    return {col: sqlite_type(dtype) for col, dtype in sample.dtypes.items()}
+
+def chunk_rows(chunk):
+    """Yield the rows of a chunk as plain Python tuples with NaN mapped to NULL"""
+    values = chunk.astype(object).where(chunk.notna(), None)
+    return values.itertuples(index=False, name=None)
+
+def detect_primary_key(table_name: str, columns, conn):
+    """Return the first of the candidate columns that is fully unique and NOT NULL, checked inside SQLite"""
+    if not columns:
+        return None
+    counts = ", ".join(f"COUNT(DISTINCT {quote_identifier(col)})" for col in columns)
+    row = conn.execute(f"SELECT COUNT(*), {counts} FROM {quote_identifier(table_name)}").fetchone()
+    total_rows, distinct_counts = row[0], row[1:]
+    for col, distinct in zip(columns, distinct_counts):
+        if total_rows and distinct == total_rows:
+            return col
+    return None
+
+def existing_columns(table_name: str, conn):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()]
+
+def create_table_from_csv(file_path: str, table_name: str, conn, chunk_size: int = CHUNK_SIZE, mode: str = "replace"):
+    """
+    Stream a CSV into SQLite in fixed-size chunks and return the ingest statistics.
+    mode="append" adds the rows to an existing table with the same columns; the
+    statistics catalog (models/stats_catalog.py) is updated from the new rows only.
+    """
+    started = time.perf_counter()
+    schema = infer_schema(file_path)
+    columns = list(schema)
+    table = quote_identifier(table_name)
+
+    current_columns = existing_columns(table_name, conn) if mode == "append" else []
+    if current_columns and sorted(current_columns) != sorted(columns):
+        raise HTTPException(status_code=400, detail=f"Columns of {file_path} do not match table {table_name}")
+    append = bool(current_columns)
+
+    # Tune SQLite for a bulk load; journal_mode cannot change inside a transaction
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+
+    column_defs = ", ".join(f"{quote_identifier(col)} {dtype}" for col, dtype in schema.items())
+    placeholders = ", ".join("?" for _ in columns)
+    insert_sql = f"INSERT INTO {table} ({', '.join(quote_identifier(col) for col in columns)}) VALUES ({placeholders})"
+
+    total_rows = 0
+    # A column can only be a primary key if it is unique and NOT NULL within every chunk
+    key_candidates = list(columns)
+    try:
+        conn.execute("BEGIN")
+        if not append:
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"CREATE TABLE {table} ({column_defs})")
+            stats_catalog.reset_table_stats(conn, table_name)
+        stats = stats_catalog.load_table_stats(conn, table_name, columns)
+        duplicates_before = stats["duplicate_rows"]
+        for chunk in pd.read_csv(file_path, chunksize=chunk_size):
+            chunk = chunk[columns]
+            if key_candidates:
+                chunk_profile = profile_table(chunk[key_candidates])
+                key_candidates = [col for col in key_candidates if chunk_profile["columns"][col]["is_unique"]]
+            conn.executemany(insert_sql, chunk_rows(chunk))
+            stats_catalog.accumulate_chunk(conn, table_name, stats, chunk)
+            total_rows += len(chunk)
+        stats_catalog.save_table_stats(conn, table_name, stats)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.execute("PRAGMA synchronous=NORMAL")
+
+    # Rows from earlier uploads count too: the catalog rules out columns with nulls or repeats
+    catalog_candidates = stats_catalog.key_candidates(stats)
+    key_candidates = [col for col in key_candidates if col in catalog_candidates]
+    primary_key = detect_primary_key(table_name, key_candidates, conn)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "primary_key": primary_key,
+        "rows": total_rows,
+        # New rows that repeat a row already in the table or earlier in this file
+        "duplicate_rows": stats["duplicate_rows"] - duplicates_before,
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(total_rows / elapsed, 1) if elapsed > 0 else None,
+    }
 
 @app.post("/upload-csv/")
-def upload_csv(files: list[UploadFile]):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+def upload_csv(files: list[UploadFile], mode: str = Query("replace", pattern="^(replace|append)$", description="Replace existing tables or append rows to them")):
     primary_keys = {}
-    
+    ingest_stats = {}
+
     for file in files:
         file_path = file.filename
         table_name = os.path.splitext(file.filename)[0]
-        with open(file_path, "wb") as f:
-            f.write(file.file.read())
-        
-        primary_key = create_table_from_csv(file_path, table_name, conn)
-        primary_keys[table_name] = primary_key
-    
+        with stage("save_upload") as current, open(file_path, "wb") as f:
+            shutil.copyfileobj(file.file, f, UPLOAD_BUFFER_SIZE)
+            current.bytes_read = f.tell()
+
+        # All writes go through the pool's single writer connection; it commits on exit.
+        # It is held per table for the ingest only, so other writers can interleave.
+        with write_connection() as conn:
+            with stage("ingest", bytes_read=os.path.getsize(file_path)) as current:
+                stats = create_table_from_csv(file_path, table_name, conn, mode=mode)
+                current.rows = stats["rows"]
+            bump_table_version(conn, table_name)
+            version = table_versions(conn, [table_name])[table_name]
+            profile = stats_catalog.catalog_profile(conn, table_name)
+            distinct_counts = {col: column["distinct_count"] for col, column in profile["columns"].items()} if profile else None
+
+        # Typed columnar copy for analyzers, stamped with the new data version. If another
+        # upload lands meanwhile the stamp is outdated and readers fall back to SQLite, as
+        # they do when the copy fails: that only costs speed.
+        with stage("columnar_copy", rows=stats["rows"]), read_connection() as conn:
+            try:
+                write_columnar(conn, table_name, version, distinct_counts)
+            except Exception:
+                logger.warning("Columnar copy of %s failed; reads fall back to SQLite", table_name, exc_info=True)
+        primary_keys[table_name] = stats.pop("primary_key")
+        ingest_stats[table_name] = stats
+
     # Foreign Key Detection
-    for table, pk in primary_keys.items():
-        if not pk:
-            continue
-        for other_table in primary_keys:
-            if other_table != table:
-                # If column name matches a primary key of another table, add FK
-                cursor.execute(f"PRAGMA table_info({table})")
-                columns = [row[1] for row in cursor.fetchall()]
-                if pk in columns:
-                    alter_sql = f"ALTER TABLE {table} ADD FOREIGN KEY ({pk}) REFERENCES {other_table}({pk});"
-                    try:
-                        cursor.execute(alter_sql)
-                    except sqlite3.OperationalError:
-                        pass
-    
-    conn.commit()
-    conn.close()
-    return {"message": "CSV files uploaded and processed.", "tables": list(primary_keys.keys())}
+    with write_connection() as conn:
+        cursor = conn.cursor()
+        for table, pk in primary_keys.items():
+            if not pk:
+                continue
+            for other_table in primary_keys:
+                if other_table != table:
+                    # If column name matches a primary key of another table, add FK
+                    cursor.execute(f"PRAGMA table_info({table})")
+                    columns = [row[1] for row in cursor.fetchall()]
+                    if pk in columns:
+                        alter_sql = f"ALTER TABLE {table} ADD FOREIGN KEY ({pk}) REFERENCES {other_table}({pk});"
+                        try:
+                            cursor.execute(alter_sql)
+                        except sqlite3.OperationalError:
+                            pass
+
+    return {"message": "CSV files uploaded and processed.", "tables": list(primary_keys.keys()), "ingest": ingest_stats}
 
@@ -3,29 +3,46 @@ from fastapi import FastAPI, HTTPException, UploadFile, File,Query
 import pandas as pd  # Add this import statement for pandas
 import numpy as np
 import io
-from models.correlation import ml_combined_correlation,combined_correlation
+from models.correlation import ml_correlation_csv, combined_correlation
 from models.fact_dimensions import detect_fact_dimension
 from models.data_quality import data_quality
-from models.business_rules import business_rule_violations
+from models.business_rules import business_rule_violations, business_rules
 from models.granularity import analyze_granularity
-from utils.helpers import json_friendly
-from models.primary_foreign_keys import extract_pk_fk_relationships
+from utils.helpers import json_friendly, list_user_tables
+from utils.cache import result_cache, cache_key, table_versions
+from models.primary_foreign_keys import extract_pk_fk_relationships, profile_relationships_csv
+from models.inclusion_dependencies import discover_inclusion_dependencies
+from models.streaming_correlation import streaming_combined_correlation, streaming_ml_combined_correlation
 import json
 from typing import List
-import sqlite3
+from utils.db import read_connection
+from utils.executor import run_cpu_bound, read_uploads, analyze_csv
+from models.profile import profile_csv
+from models.preview import CONFIDENCE, preview_csv
+from models.duplicates import NEAR_THRESHOLD, check_csv_duplicates, near_duplicates
+from utils.jobs import submit_job, recover_jobs, get_job, get_job_result, get_job_events
+from utils.metrics import instrument, stage
+from utils.serialization import FastJSONResponse
+from fastapi.responses import Response, StreamingResponse
+from contextlib import asynccontextmanager
+import asyncio
 
-app = FastAPI()
+JOB_POLL_INTERVAL = 0.5  # seconds between checks when streaming job events
 
-def get_db_connection():
-    return sqlite3.connect("database.db")  # Replace with your actual database file
+
+@asynccontextmanager
+async def lifespan(app):
+    # Jobs cut off by the last shutdown are marked interrupted; finished results stay available
+    recover_jobs()
+    yield
+
+
+app = instrument(FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse))
 
 @app.get("/list-tables/")
 def list_tables():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-    tables = [row[0] for row in cursor.fetchall()]
-    conn.close()
+    with read_connection() as conn:
+        tables = list_user_tables(conn)
     return {"tables": tables}
 
 @app.get("/table-columns/")
@@ -34,47 +51,194 @@ def get_table_columns(table_names: List[str] = Query(..., description="Enter tab
     Retrieve columns for multiple tables.
     Example: /table-columns/?table_names=category1&table_names=customer1
     """
-    conn = get_db_connection()
-    cursor = conn.cursor()
     result = {}
 
-    for table_name in table_names:
-        cursor.execute(f"PRAGMA table_info({table_name.strip()})")
-        columns = [row[1] for row in cursor.fetchall()]
-        result[table_name.strip()] = columns if columns else "Table not found"
+    with read_connection() as conn:
+        for table_name in table_names:
+            cursor = conn.execute(f"PRAGMA table_info({table_name.strip()})")
+            columns = [row[1] for row in cursor.fetchall()]
+            result[table_name.strip()] = columns if columns else "Table not found"
     
-    conn.close()
     return result
 
 
 @app.get("/data-quality")
-def quality(table_names: str = None):
+def quality(table_names: str = None, pushdown: bool = Query(False, description="Bypass the statistics catalog and compute exact metrics inside SQLite instead of loading the tables"), rescan: bool = Query(False, description="Ignore the statistics catalog and scan the tables in full"), workers: int = Query(None, gt=0, description="Processes used for full scans"), sample_size: int = Query(None, gt=0, description="Preview: estimate the metrics from this many sampled rows per table"), confidence: float = Query(CONFIDENCE, gt=0, lt=1, description="Confidence level of preview intervals")):
     table_names_list = table_names.split(",") if table_names else None
-    return data_quality(table_names_list)
+    result = data_quality(table_names_list, pushdown=pushdown, rescan=rescan, workers=workers, sample_size=sample_size, confidence=confidence)
+    with stage("serialize"):
+        return FastJSONResponse(result)
 
 
-@app.post("/profile-data/")
-async def profile_data(files: list[UploadFile] = File(...)):
-    tables = {}
+@app.get("/business-rules/")
+def rule_violations(table_names: str = None, pushdown: bool = Query(False, description="Count violations inside SQLite instead of loading the tables")):
+    """Violation counts, sample offending rows and evaluation time of each declared rule, per table"""
+    table_names_list = table_names.split(",") if table_names else None
+    result = business_rules(table_names_list, pushdown=pushdown)
+    with stage("serialize"):
+        return FastJSONResponse(result)
+
+
+def require_stored_tables(conn, *table_names):
+    """404 unless every name is a stored table; the streaming sources would otherwise open a .csv name as a file path"""
+    stored = set(list_user_tables(conn))
+    for table_name in table_names:
+        if table_name not in stored:
+            raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+
+
+@app.get("/table-correlation/")
+def table_correlation(table1: str, table2: str, method: str = Query("pearson", pattern="^pearson$")):
+    """Correlate two stored tables in one streaming pass without loading either into memory"""
+    with read_connection() as conn:
+        require_stored_tables(conn, table1, table2)
+        versions = table_versions(conn, [table1, table2])
+    key = cache_key("table-correlation", table1, versions[table1], table2, versions[table2], method)
+    result = result_cache.get(key)
+    if result is None:
+        result = streaming_combined_correlation(table1, table2, method)
+        result_cache.set(key, result, tags=[table1, table2])
+    return FastJSONResponse(result)
+
 
-    # Read each uploaded file
-    for file in files:
-        df = pd.read_csv(io.StringIO(file.file.read().decode("utf-8")))
-        tables[file.filename] = df
+@app.post("/duplicates/check/")
+async def duplicates_check(table_name: str, file: UploadFile = File(...)):
+    """Rows of an uploaded CSV that already exist in a stored table or repeat within the file, found through the table's fingerprint index"""
+    contents = await read_uploads([file])
+    # A thread rather than a worker: only fingerprints are kept, and errors are HTTPExceptions
+    result = await asyncio.to_thread(check_csv_duplicates, *contents.values(), table_name)
+    return FastJSONResponse(result)
+
+
+@app.get("/near-duplicates/")
+def near_duplicate_records(table_name: str, columns: List[str] = Query(..., description="Columns forming the record text, e.g. customer_name and email"), threshold: float = Query(NEAR_THRESHOLD, ge=0.5, le=1, description="Minimum estimated Jaccard similarity"), limit: int = Query(100, gt=0)):
+    """Pairs of similar records found with MinHash/LSH; the index is built on first use and after uploads"""
+    result = near_duplicates(table_name, columns, threshold, limit)
+    with stage("serialize"):
+        return FastJSONResponse(result)
+
+
+@app.get("/cache-stats/")
+def cache_stats():
+    """Hit/miss counters and size of the analysis result cache"""
+    return result_cache.stats()
+
+
+async def analyze_uploads(analyzer, contents, approx_error=None, inclusion=False, sample_size=None, confidence=CONFIDENCE):
+    """
+    Run a table analyzer on uploaded CSVs off the event loop. Each file is parsed and
+    profiled in its own worker; value-based inclusion needs all tables in one process.
+    With sample_size each file is previewed from a reservoir sample of that many rows.
+    """
+    if sample_size:
+        if inclusion:
+            raise HTTPException(status_code=400, detail="Value-based inclusion needs the full tables and cannot be previewed")
+        profiles = await asyncio.gather(*(run_cpu_bound(preview_csv, content, sample_size, confidence) for content in contents.values()))
+    elif inclusion:
+        return await run_cpu_bound(analyze_csv, analyzer, contents, {"approx_error": approx_error, "inclusion": True})
+    else:
+        profiles = await asyncio.gather(*(run_cpu_bound(profile_csv, content, approx_error) for content in contents.values()))
+    return analyzer(None, profiles=dict(zip(contents, profiles)))
+
+
+@app.post("/profile-data/")
+async def profile_data(files: list[UploadFile] = File(...), approx_error: float = Query(None, gt=0, lt=1, description="Use approximate distinct counts with this relative error"), inclusion: bool = Query(False, description="Detect FKs by value containment instead of column names"), sample_size: int = Query(None, gt=0, description="Preview: profile a reservoir sample of this many rows per file"), confidence: float = Query(CONFIDENCE, gt=0, lt=1, description="Confidence level of preview intervals")):
+    contents = await read_uploads(files)
 
-    result = extract_pk_fk_relationships(tables)
+    # Identical uploads with identical options reuse the previous result
+    key = await asyncio.to_thread(cache_key, "profile-data", approx_error, inclusion, sample_size, confidence, *[part for item in contents.items() for part in item])
+    result = result_cache.get(key)
+    if result is None:
+        result = await analyze_uploads(extract_pk_fk_relationships, contents, approx_error, inclusion, sample_size, confidence)
+        result_cache.set(key, result)
 
-    return json.loads(json.dumps(result, indent=4))
+    with stage("serialize"):
+        return FastJSONResponse(result)
 
 
 @app.post("/fact-and-dimention-tables/")
-async def classify_tables(files: list[UploadFile] = File(...)):
-    tables = {}
+async def classify_tables(files: list[UploadFile] = File(...), approx_error: float = Query(None, gt=0, lt=1, description="Use approximate distinct counts with this relative error"), inclusion: bool = Query(False, description="Classify by value containment instead of column names")):
+    contents = await read_uploads(files)
     
-    for file in files:
-        df = pd.read_csv(io.StringIO(file.file.read().decode("utf-8")))
-        tables[file.filename] = df
+    key = await asyncio.to_thread(cache_key, "fact-and-dimension", approx_error, inclusion, *[part for item in contents.items() for part in item])
+    result = result_cache.get(key)
+    if result is None:
+        result = await analyze_uploads(detect_fact_dimension, contents, approx_error, inclusion)
+        result_cache.set(key, result)
     
-    result = detect_fact_dimension(tables)
-    
-    return json.loads(json.dumps(result))
\ No newline at end of file
+    with stage("serialize"):
+        return FastJSONResponse(result)
+
+
+@app.post("/inclusion-dependencies/")
+async def inclusion_dependencies(files: list[UploadFile] = File(...), min_containment: float = Query(0.9, ge=0, le=1)):
+    """Find FK candidates whose values are contained in a unique column of another uploaded table"""
+    contents = await read_uploads(files)
+
+    result = await run_cpu_bound(analyze_csv, discover_inclusion_dependencies, contents, {"min_containment": min_containment})
+
+    with stage("serialize"):
+        return FastJSONResponse(result)
+
+
+
+@app.post("/jobs/ml-correlation/")
+async def submit_ml_correlation(file1: UploadFile = File(...), file2: UploadFile = File(...), max_rows: int = Query(None, gt=0), max_workers: int = Query(None, gt=0), sample_size: int = Query(None, gt=0, description="Preview: analyze this many sampled rows"), stratify: str = Query(None, description="File 1 column to stratify the preview sample by"), confidence: float = Query(CONFIDENCE, gt=0, lt=1, description="Confidence level of preview intervals")):
+    """Start ml_combined_correlation in the background; progress is reported per target column"""
+    contents = await read_uploads([file1, file2])
+    job_id = submit_job("ml-correlation", ml_correlation_csv, *contents.values(), max_workers=max_workers, max_rows=max_rows, sample_size=sample_size, stratify=stratify, confidence=confidence)
+    return {"job_id": job_id}
+
+
+@app.post("/jobs/profile-data/")
+async def submit_profile_data(files: list[UploadFile] = File(...), approx_error: float = Query(None, gt=0, lt=1)):
+    """Start PK/FK profiling of the uploaded tables in the background; progress is reported per table"""
+    contents = await read_uploads(files)
+    job_id = submit_job("profile-data", profile_relationships_csv, contents, approx_error=approx_error)
+    return {"job_id": job_id}
+
+
+@app.post("/jobs/table-ml-correlation/")
+def submit_table_ml_correlation(table1: str, table2: str):
+    """Start ml_combined_correlation on two stored tables, training from disk in chunks"""
+    with read_connection() as conn:
+        require_stored_tables(conn, table1, table2)
+    job_id = submit_job("table-ml-correlation", streaming_ml_combined_correlation, table1, table2)
+    return {"job_id": job_id}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return get_job(job_id)
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    # Stored as JSON already; sent as is instead of decoded and encoded again
+    return Response(get_job_result(job_id, decode=False), media_type="application/json")
+
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str, after: int = Query(0, ge=0, description="Only return events after this sequence number")):
+    """Partial results recorded so far, e.g. one per finished target column"""
+    return get_job_events(job_id, after)
+
+
+@app.get("/jobs/{job_id}/stream")
+async def job_stream(job_id: str):
+    """Stream partial results as newline-delimited JSON until the job finishes"""
+    get_job(job_id)
+
+    async def events():
+        seen = 0
+        while True:
+            job = await asyncio.to_thread(get_job, job_id)
+            for event in await asyncio.to_thread(get_job_events, job_id, seen):
+                seen = event["seq"]
+                yield json.dumps(event) + "\n"
+            if job["status"] not in ("queued", "running"):
+                yield json.dumps({"status": job["status"], "error": job["error"]}) + "\n"
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
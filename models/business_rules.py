@@ -1,13 +1,226 @@
 # models/business_rules.py
-from utils.helpers import json_friendly
+import ast
+import json
+import os
+import re
+import time
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from utils.helpers import list_user_tables, quote_identifier
+from utils.cache import result_cache, cache_key, table_versions
+from utils.db import read_connection
+from utils.metrics import stage
+from models.data_quality import get_data_from_table
 
-def business_rule_violations(data1):
-    """Detect violations of basic business rules"""
+RULES_FILE = os.environ.get("BUSINESS_RULES_FILE", "business_rules.json")
+SAMPLE_SIZE = 10  # offending row numbers reported per rule
+RULE_TYPES = ("range", "regex", "not_null", "allowed", "expression")
+# Used when no rules file exists: the check this module always had
+DEFAULT_RULES = [{"name": "negative_QuantitySold", "type": "range", "column": "QuantitySold", "min": 0}]
+
+
+class Rule:
+    """
+    One declared rule, compiled to a vectorized violation mask over a DataFrame and to
+    an SQLite condition that is true for the same rows. Nulls only violate not_null;
+    an expression is only checked on rows where every column it names is present.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.kind = spec.get("type")
+        if self.kind not in RULE_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unknown rule type {self.kind!r}; expected one of {', '.join(RULE_TYPES)}")
+        if self.kind == "expression":
+            if "expression" not in spec:
+                raise HTTPException(status_code=400, detail="Expression rules need an 'expression'")
+            try:
+                tree = ast.parse(spec["expression"], mode="eval")
+            except SyntaxError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid expression {spec['expression']!r}: {e.msg}")
+            # Column references only: keywords and literals are not Name nodes
+            self.columns = sorted({node.id for node in ast.walk(tree) if isinstance(node, ast.Name)})
+        else:
+            if "column" not in spec:
+                raise HTTPException(status_code=400, detail=f"{self.kind} rules need a 'column'")
+            self.columns = [spec["column"]]
+        if self.kind == "regex":
+            self.pattern = re.compile(spec["pattern"])
+        self.name = spec.get("name") or f"{self.kind}_{'_'.join(self.columns)}"
+        self.tables = spec.get("tables")
+
+    def applies_to(self, table_name, columns):
+        """Rules without 'tables' apply wherever all their columns exist"""
+        if self.tables is not None and table_name not in self.tables:
+            return False
+        return all(col in columns for col in self.columns)
+
+    def violations(self, df):
+        """Boolean NumPy mask of the rows that break the rule"""
+        if self.kind == "expression":
+            present = df[self.columns].notna().all(axis=1).to_numpy()
+            valid = df.eval(self.spec["expression"])
+            return present & ~np.asarray(valid, dtype=bool)
+
+        series = df[self.columns[0]]
+        present = series.notna().to_numpy()
+        if self.kind == "not_null":
+            return ~present
+        if self.kind == "range":
+            values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            outside = np.zeros(len(values), dtype=bool)
+            with np.errstate(invalid="ignore"):
+                if self.spec.get("min") is not None:
+                    outside |= values < self.spec["min"]
+                if self.spec.get("max") is not None:
+                    outside |= values > self.spec["max"]
+            return present & outside
+        if self.kind == "regex":
+            # Each distinct value is matched once; codes are -1 for nulls
+            codes, uniques = pd.factorize(series)
+            matched = pd.Series(uniques.astype(str)).str.fullmatch(self.pattern.pattern).to_numpy(dtype=bool)
+            return present & ~matched[codes]
+        return present & ~series.isin(self.spec["values"]).to_numpy()
+
+    def sql(self):
+        """(condition, parameters) selecting the violating rows in SQLite"""
+        if self.kind == "expression":
+            present = " AND ".join(f"{quote_identifier(col)} IS NOT NULL" for col in self.columns)
+            return f"({present} AND NOT ({self.spec.get('sql', self.spec['expression'])}))", []
+
+        column = quote_identifier(self.columns[0])
+        if self.kind == "not_null":
+            return f"({column} IS NULL)", []
+        if self.kind == "range":
+            bounds, params = [], []
+            if self.spec.get("min") is not None:
+                bounds.append(f"{column} < ?")
+                params.append(self.spec["min"])
+            if self.spec.get("max") is not None:
+                bounds.append(f"{column} > ?")
+                params.append(self.spec["max"])
+            return f"({column} IS NOT NULL AND ({' OR '.join(bounds) or '0'}))", params
+        if self.kind == "regex":
+            return f"({column} IS NOT NULL AND NOT regexp(?, {column}))", [self.pattern.pattern]
+        values = list(self.spec["values"])
+        return f"({column} IS NOT NULL AND {column} NOT IN ({', '.join('?' for _ in values) or 'NULL'}))", values
+
+
+def load_rules(path=RULES_FILE):
+    """Rules declared in the JSON rules file ({"rules": [...]}), or DEFAULT_RULES without one"""
+    if not os.path.exists(path):
+        return [Rule(spec) for spec in DEFAULT_RULES]
+    with open(path) as f:
+        config = json.load(f)
+    return [Rule(spec) for spec in config.get("rules", [])]
+
+
+def rules_fingerprint(rules):
+    """Stable text of the rule declarations, for cache keys"""
+    return json.dumps([rule.spec for rule in rules], sort_keys=True)
+
+
+def evaluate_rules(df, rules, table_name=None, sample_size=SAMPLE_SIZE):
+    """
+    Evaluate every applicable rule on an in-memory table in one pass over its columns.
+    Sample rows are 0-based row numbers.
+    """
+    results = {}
+    with stage("business_rules", rows=len(df)):
+        for rule in rules:
+            if not rule.applies_to(table_name, df.columns):
+                continue
+            started = time.perf_counter()
+            mask = rule.violations(df)
+            results[rule.name] = {
+                "type": rule.kind,
+                "violations": int(mask.sum()),
+                "sample_rows": np.flatnonzero(mask)[:sample_size].tolist(),
+                "seconds": round(time.perf_counter() - started, 6),
+            }
+    return {"rows": len(df), "rules": results}
+
+
+def evaluate_rules_sql(conn, table_name, rules, sample_size=SAMPLE_SIZE):
+    """
+    The same report computed inside SQLite: all violation counts come from a single
+    aggregate scan of the table, then each rule with violations fetches its first rows.
+    Sample rows are rowid - 1, the row number for tables that are only ever appended to.
+    """
+    table = quote_identifier(table_name)
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if not columns:
+        raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+    applicable = [rule for rule in rules if rule.applies_to(table_name, columns)]
+
+    with stage("business_rules_sql") as current:
+        conditions = [rule.sql() for rule in applicable]
+        counts = ", ".join(f"COALESCE(SUM(CASE WHEN {condition} THEN 1 ELSE 0 END), 0)" for condition, _ in conditions)
+        params = [param for _, rule_params in conditions for param in rule_params]
+        started = time.perf_counter()
+        row = conn.execute(f"SELECT COUNT(*){', ' + counts if counts else ''} FROM {table}", params).fetchone()
+        scan_seconds = time.perf_counter() - started
+        current.rows = row[0]
+
+        results = {}
+        for rule, (condition, rule_params), violations in zip(applicable, conditions, row[1:]):
+            started = time.perf_counter()
+            sample = []
+            if violations:
+                sample = [rowid - 1 for (rowid,) in conn.execute(
+                    f"SELECT rowid FROM {table} WHERE {condition} ORDER BY rowid LIMIT ?", [*rule_params, sample_size]
+                )]
+            results[rule.name] = {
+                "type": rule.kind,
+                "violations": violations,
+                "sample_rows": sample,
+                "seconds": round(time.perf_counter() - started, 6),
+            }
+    return {"rows": row[0], "scan_seconds": round(scan_seconds, 6), "rules": results}
+
+
+def table_rule_report(table_name, rules, pushdown=False):
+    """
+    Rule report for a stored table. In memory only the columns the rules reference are
+    loaded; with pushdown SQLite checks every rule in one scan.
+    """
+    with read_connection() as conn:
+        if pushdown:
+            return evaluate_rules_sql(conn, table_name, rules)
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()]
+        if not columns:
+            raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+        applicable = [rule for rule in rules if rule.applies_to(table_name, columns)]
+        needed = [col for col in columns if any(col in rule.columns for rule in applicable)]
+        if not needed:
+            return {"rows": conn.execute(f"SELECT COUNT(*) FROM {quote_identifier(table_name)}").fetchone()[0], "rules": {}}
+    return evaluate_rules(get_data_from_table(table_name, needed), applicable, table_name)
+
+
+def business_rules(table_names=None, pushdown=False, rules=None):
+    """Rule reports for the given stored tables (all by default), cached per table version and rule set"""
+    rules = load_rules() if rules is None else rules
+    fingerprint = rules_fingerprint(rules)
+    with read_connection() as conn:
+        table_names = table_names or list_user_tables(conn)
+        versions = table_versions(conn, table_names)
+
+    reports = {}
+    for table_name in table_names:
+        key = cache_key("business-rules", table_name, versions[table_name], fingerprint, pushdown)
+        report = result_cache.get(key)
+        if report is None:
+            report = table_rule_report(table_name, rules, pushdown)
+            result_cache.set(key, report, tags=[table_name])
+        reports[table_name] = report
+    return reports
+
+
+def business_rule_violations(data1, rules=None):
+    """Detect violations of the declared business rules; returns {rule name: violation count}"""
     if data1 is None:
         raise HTTPException(status_code=400, detail="No data uploaded")
-    
-    violations = {}
-    if "QuantitySold" in data1.columns:
-        violations["negative_QuantitySold"] = int((data1["QuantitySold"] < 0).sum())
-    
-    return {key: json_friendly(value) for key, value in violations.items()}
+
+    report = evaluate_rules(data1, load_rules() if rules is None else rules)
+    return {name: result["violations"] for name, result in report["rules"].items()}
@@ -1,18 +1,207 @@
 from fastapi import HTTPException
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestRegressor
 import xgboost as xgb
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error
-from utils.helpers import json_friendly
+from utils.frames import encode_column, load_csv
+from utils.metrics import stage
+from utils.sampling import sample_frame
+from models.preview import CONFIDENCE, mean_interval
 
-def ml_combined_correlation(data1, data2):
+XGB_PARAMS = {
+    'objective': 'reg:squarederror',
+    'eval_metric': 'rmse',
+    'max_depth': 6,
+    'eta': 0.3,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'tree_method': 'hist',
+}
+XGB_NUM_BOOST_ROUND = 100
+XGB_EARLY_STOPPING_ROUNDS = 10
+PARALLEL_MIN_CELLS = 1_000_000  # below this, process start-up costs more than it saves
+
+# Per-worker copy of the prepared matrices, set once by the pool initializer
+_xgb_datasets = {}
+
+
+def prepare_xgb_dataset(values, columns, max_rows=None, confidence=None):
+    """
+    Float32 matrix, column names and a single train/test split shared by every target column.
+    With confidence set, results carry an interval for the test MSE at that level.
+    """
+    if max_rows and len(values) > max_rows:
+        rows = np.sort(np.random.default_rng(42).choice(len(values), max_rows, replace=False))
+        values = values[rows]
+    train_idx, test_idx = train_test_split(np.arange(len(values)), test_size=0.2, random_state=42)
+    return {"values": values, "columns": list(columns), "train": train_idx, "test": test_idx, "confidence": confidence}
+
+
+def compute_xgb_importance(dataset, target_col, nthread=1):
+    """Train an XGBoost model and get feature importance for the given target column."""
+    if target_col not in dataset["columns"]:
+        return None
+
+    target = dataset["columns"].index(target_col)
+    features = [col for col in dataset["columns"] if col != target_col]
+    y = dataset["values"][:, target].astype(float)
+    X_values = np.delete(dataset["values"], target, axis=1)
+
+    if len(np.unique(y)) == 1:
+        return None
+
+    train, test = dataset["train"], dataset["test"]
+    dtrain = xgb.DMatrix(X_values[train], label=y[train], feature_names=features, nthread=nthread)
+    dtest = xgb.DMatrix(X_values[test], label=y[test], feature_names=features, nthread=nthread)
+
+    model = xgb.train(
+        dict(XGB_PARAMS, nthread=nthread),
+        dtrain,
+        num_boost_round=XGB_NUM_BOOST_ROUND,
+        evals=[(dtrain, 'train'), (dtest, 'test')],
+        early_stopping_rounds=XGB_EARLY_STOPPING_ROUNDS,
+        verbose_eval=False
+    )
+
+    # Calculate MSE on the test split using the best iteration
+    y_pred = model.predict(dtest, iteration_range=(0, model.best_iteration + 1))
+    mse = mean_squared_error(y[test], y_pred)
+
+    result = importance_result(model, features, mse)
+    if dataset.get("confidence"):
+        result["metrics"]["mse_interval"] = [max(0.0, bound) for bound in mean_interval((y[test] - y_pred) ** 2, dataset["confidence"])]
+    return result
+
+
+def importance_result(model, features, mse):
+    """Normalized gain importance of every feature, highest first, with the model's test MSE"""
+    feature_importance = model.get_score(importance_type='gain')
+    
+    # Normalize feature importance scores
+    total_importance = sum(feature_importance.values())
+    if total_importance > 0:
+        feature_importance = {k: v/total_importance for k, v in feature_importance.items()}
+    
+    # Ensure all features have an importance score
+    for feature in features:
+        if feature not in feature_importance:
+            feature_importance[feature] = 0.0
+    
+    return {
+        "correlations": {
+            feature: float(importance)
+            for feature, importance in sorted(
+                feature_importance.items(),
+                key=lambda x: x[1],
+                reverse=True
+            )
+        },
+        "metrics": {
+            "mse": float(mse) if mse is not None else None
+        }
+    }
+
+
+def _init_xgb_worker(datasets):
+    _xgb_datasets.update(datasets)
+
+
+def _xgb_worker(dataset_name, target_col, nthread):
+    return compute_xgb_importance(_xgb_datasets[dataset_name], target_col, nthread)
+
+
+def run_xgb_tasks(datasets, tasks, max_workers=None, on_result=None):
+    """
+    Train one model per (dataset name, target column) task and return the results in task order.
+    Large inputs fan out over a process pool, each worker getting an equal share of the cores.
+    on_result(task_index, result) is called as each task finishes, in completion order.
+    """
+    cores = os.cpu_count() or 1
+    if max_workers is None:
+        cells = max(dataset["values"].size for dataset in datasets.values())
+        max_workers = cores if cells * len(tasks) >= PARALLEL_MIN_CELLS else 1
+    max_workers = max(1, min(max_workers, len(tasks)))
+    nthread = max(1, cores // max_workers)
+
+    results = [None] * len(tasks)
+    try:
+        if max_workers == 1:
+            for i, (name, col) in enumerate(tasks):
+                with stage("xgb_train", rows=len(datasets[name]["values"])):
+                    results[i] = compute_xgb_importance(datasets[name], col, nthread)
+                if on_result:
+                    on_result(i, results[i])
+            return results
+
+        # spawn: forking a process that already initialised OpenMP can deadlock
+        rows = sum(len(datasets[name]["values"]) for name, _ in tasks)
+        with stage("xgb_train", rows=rows), ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_xgb_worker,
+            initargs=(datasets,),
+        ) as pool:
+            futures = {pool.submit(_xgb_worker, name, col, nthread): i for i, (name, col) in enumerate(tasks)}
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                if on_result:
+                    on_result(i, results[i])
+            return results
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"XGBoost training error: {str(e)}")
+
+
+def clean_file1_result(result):
+    """Rename combined feature names such as file2_price to 'price (file2)'"""
+    cleaned_correlations = {}
+    for feat, imp in result["correlations"].items():
+        source, clean_name = feat.split('_', 1)
+        cleaned_correlations[f"{clean_name} ({source})"] = imp
+    return {
+        "correlations": cleaned_correlations,
+        "metrics": result["metrics"]
+    }
+
+
+def feature_values(series):
+    """
+    One column as float64 model input: non-numeric columns label-encoded (categoricals
+    from their codes), missing values filled with the column median, or 0 if all missing.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    else:
+        values = encode_column(series).astype(np.float64)
+    missing = np.isnan(values)
+    if missing.any():
+        fill = np.median(values[~missing]) if not missing.all() else 0.0
+        values = np.where(missing, fill, values)
+    return values
+
+
+def fill_feature_columns(df, out, rows=None):
+    """Write the model inputs of every column of df into the float32 matrix out, optionally only the given rows"""
+    for i, col in enumerate(df.columns):
+        values = feature_values(df[col])
+        out[:, i] = values if rows is None else values[rows]
+
+
+def ml_combined_correlation(data1, data2, max_workers=None, max_rows=None, progress=None, sample_size=None, stratify=None, confidence=CONFIDENCE):
     """
     Compute correlations where:
     - File 1 columns are correlated with all columns from both files
     - File 2 columns are correlated only with File 2 columns
+    max_workers bounds the training processes (default: all cores for large inputs);
+    max_rows trains on a fixed random subsample of larger inputs.
+    progress(done, total, partial) is called after every target column, with partial
+    holding that column's section, name and result.
+    With sample_size the whole analysis runs on that many aligned rows of both files,
+    stratified by file 1's `stratify` column if given, as a quick preview.
     """
     if data1 is None or data2 is None:
         raise HTTPException(status_code=400, detail="Two datasets are required")
@@ -22,177 +211,183 @@ def ml_combined_correlation(data1, data2):
         "file2_correlations": {}   # Correlations for file 2 columns with file 2 columns only
     }
 
-    data1 = data1.copy()
-    data2 = data2.copy()
-
     # Ensure data1 and data2 are pandas DataFrames
     if not isinstance(data1, pd.DataFrame):
         raise HTTPException(status_code=400, detail="data1 is not a valid DataFrame")
     if not isinstance(data2, pd.DataFrame):
         raise HTTPException(status_code=400, detail="data2 is not a valid DataFrame")
 
-    # Convert categorical columns to numerical using Label Encoding
-    for df in [data1, data2]:
-        for col in df.select_dtypes(include=["object", "category"]).columns:
-            df[col] = LabelEncoder().fit_transform(df[col].astype(str))
-
-    # Fill missing values with median, then ensure no NaNs remain
-    for df in [data1, data2]:
-        df.fillna(df.median(numeric_only=True), inplace=True)
-        df.fillna(0, inplace=True)
-
-    # Convert all columns to float32 for XGBoost compatibility
-    data1 = data1.astype(np.float32)
-    data2 = data2.astype(np.float32)
-
-    def compute_xgb_importance(df, target_col):
-        """Train an XGBoost model and get feature importance for the given target column."""
-        if target_col not in df.columns:
-            return None
-        
-        X = df.drop(columns=[target_col])
-        y = df[target_col].values.ravel().astype(float)
-
-        X_values = X.values.astype(np.float32)
-        
-        if not np.issubdtype(X_values.dtype, np.number):
-            raise HTTPException(status_code=500, detail="X contains non-numeric data")
-
-        if len(set(y)) == 1:
-            return None
-
-        X_train, X_test, y_train, y_test = train_test_split(X_values, y, test_size=0.2, random_state=42)
-
-        # Create DMatrix objects
-        dtrain = xgb.DMatrix(X_train, label=y_train, feature_names=list(X.columns))
-        dtest = xgb.DMatrix(X_test, label=y_test, feature_names=list(X.columns))
-
-        params = {
-            'objective': 'reg:squarederror',
-            'eval_metric': 'rmse',
-            'max_depth': 6,
-            'eta': 0.3,
-            'subsample': 0.8,
-            'colsample_bytree': 0.8
-        }
+    preview = None
+    if sample_size:
+        if stratify is not None and stratify not in data1.columns:
+            raise HTTPException(status_code=400, detail=f"Unknown stratify column: {stratify}")
+        common = data1.index.intersection(data2.index, sort=False)
+        with stage("sample") as current:
+            # Only the stratify column is needed to pick the rows
+            rows = sample_frame(data1.loc[common, [stratify] if stratify else []], sample_size, stratify).index
+            data1, data2 = data1.loc[rows], data2.loc[rows]
+            current.rows = len(rows)
+        preview = {"rows": len(rows), "population_rows": len(common), "method": "stratified" if stratify else "uniform", "confidence": confidence, "exact": len(rows) >= len(common)}
 
-        try:
-            model = xgb.train(
-                params,
-                dtrain,
-                num_boost_round=100,
-                evals=[(dtrain, 'train'), (dtest, 'test')],
-                verbose_eval=False
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"XGBoost training error: {str(e)}")
-
-        feature_importance = model.get_score(importance_type='gain')
-        
-        # Normalize feature importance scores
-        total_importance = sum(feature_importance.values())
-        if total_importance > 0:
-            feature_importance = {k: v/total_importance for k, v in feature_importance.items()}
-        
-        # Ensure all features have an importance score
-        for feature in X.columns:
-            if feature not in feature_importance:
-                feature_importance[feature] = 0.0
-
-        # Calculate MSE and R-squared
-        y_pred = model.predict(dtest)
-        mse = mean_squared_error(y_test, y_pred)
-        
-        return {
-            "correlations": {
-                feature: json_friendly(importance)
-                for feature, importance in sorted(
-                    feature_importance.items(),
-                    key=lambda x: x[1],
-                    reverse=True
-                )
-            },
-            "metrics": {
-                "mse": json_friendly(mse)
-            }
-        }
+    # Both matrices are filled column by column; the input frames are never copied
+    common = data1.index.intersection(data2.index, sort=False)
+    file1_columns = [f"file1_{col}" for col in data1.columns]
+    file2_columns = [f"file2_{col}" for col in data2.columns]
+    combined = np.empty((len(common), len(data1.columns) + len(data2.columns)), dtype=np.float32)
+    file2 = np.empty((len(data2), len(data2.columns)), dtype=np.float32)
+    fill_feature_columns(data1, combined[:, :len(data1.columns)], data1.index.get_indexer(common))
+    fill_feature_columns(data2, file2)
+    combined[:, len(data1.columns):] = file2[data2.index.get_indexer(common)]
 
-    # Process File 1 columns (correlate with all columns)
-    combined_df = pd.concat([data1, data2], axis=1, join="inner", keys=['file1', 'file2'])
-    combined_df.columns = [f"{key}_{col}" for key, col in combined_df.columns]
-    
-    for col in data1.columns:
-        target_col = f"file1_{col}"
-        result = compute_xgb_importance(combined_df, target_col)
+    interval_level = confidence if preview else None
+    datasets = {
+        "combined": prepare_xgb_dataset(combined, file1_columns + file2_columns, max_rows, interval_level),
+        "file2": prepare_xgb_dataset(file2, data2.columns, max_rows, interval_level),
+    }
+    tasks = [("combined", f"file1_{col}") for col in data1.columns] + [("file2", col) for col in data2.columns]
+    targets = [("file1_correlations", col) for col in data1.columns] + [("file2_correlations", col) for col in data2.columns]
+
+    completed = []
+    def report(i, result):
+        completed.append(i)
+        section, col = targets[i]
+        if result and section == "file1_correlations":
+            result = clean_file1_result(result)
+        progress(len(completed), len(tasks), {"section": section, "column": col, "result": result})
+
+    results = run_xgb_tasks(datasets, tasks, max_workers, on_result=report if progress else None)
+
+    file1_results = results[:len(data1.columns)]
+    file2_results = results[len(data1.columns):]
+
+    for col, result in zip(data1.columns, file1_results):
         if result:
             # Clean up column names in results
-            cleaned_correlations = {}
-            for feat, imp in result["correlations"].items():
-                source, clean_name = feat.split('_', 1)
-                cleaned_correlations[f"{clean_name} ({source})"] = imp
-            
-            correlation_results["file1_correlations"][col] = {
-                "correlations": cleaned_correlations,
-                "metrics": result["metrics"]
-            }
-
-    # Process File 2 columns (correlate only with File 2 columns)
-    for col in data2.columns:
-        result = compute_xgb_importance(data2, col)
+            correlation_results["file1_correlations"][col] = clean_file1_result(result)
+
+    # File 2 columns are correlated only with File 2 columns
+    for col, result in zip(data2.columns, file2_results):
         if result:
             correlation_results["file2_correlations"][col] = result
 
+    if preview:
+        correlation_results["preview"] = preview
+        if not preview["exact"]:
+            # Importances of a sample are estimates; a column constant in the sample may still vary
+            correlation_results["needs_confirmation"] = [
+                {"section": section, "column": col, "conclusion": "importance ranking" if result else "constant, no model"}
+                for (section, col), result in zip(targets, results)
+            ]
+
     return correlation_results
 
 
-def combined_correlation(data1, data2):
-        """Compute combined column correlations for two datasets and store results in a single dictionary"""
-        if data1 is None or data2 is None:
-            raise HTTPException(status_code=400, detail="Two datasets are required")
+def label_encode(df):
+    """Numeric copy of df with non-numeric columns label-encoded (sorted, as LabelEncoder does)"""
+    encoded = {}
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            encoded[col] = df[col]
+        else:
+            encoded[col] = encode_column(df[col])
+    return pd.DataFrame(encoded, index=df.index, columns=df.columns)
+
+
+def pearson_matrix(X):
+    """Pearson correlation of every column pair of a complete float matrix in one BLAS call"""
+    centered = X - X.mean(axis=0)
+    cov = centered.T @ centered
+    scale = np.sqrt(np.diag(cov))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        corr = cov / np.outer(scale, scale)
+    return np.clip(corr, -1.0, 1.0)
+
 
-        correlation_results = {}
+def pairwise_pearson_matrix(X):
+    """Pearson correlation with pairwise deletion of NaNs, matching Series.corr for every pair"""
+    present = ~np.isnan(X)
+    # Centering by the column means keeps the sums below well conditioned
+    X = np.where(present, X - np.nanmean(X, axis=0), 0.0)
+    mask = present.astype(X.dtype)
 
-        data1 = data1.copy()
-        data2 = data2.copy()
+    n = mask.T @ mask
+    sum_x = X.T @ mask  # sum of column i over the rows where i and j are both present
+    sum_xx = (X * X).T @ mask
+    sum_xy = X.T @ X
 
-        # Convert categorical columns to numerical using Label Encoding
-        encoders1 = {}
-        for col in data1.select_dtypes(include=["object"]).columns:
-            encoders1[col] = LabelEncoder()
-            data1[col] = encoders1[col].fit_transform(data1[col].astype(str))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sum_xy - sum_x * sum_x.T / n
+        var_x = sum_xx - sum_x ** 2 / n
+        corr = cov / np.sqrt(var_x * var_x.T)
+    corr[n < 2] = np.nan
+    return np.clip(corr, -1.0, 1.0)
 
-        encoders2 = {}
-        for col in data2.select_dtypes(include=["object"]).columns:
-            encoders2[col] = LabelEncoder()
-            data2[col] = encoders2[col].fit_transform(data2[col].astype(str))
 
-        data1.fillna(data1.median(numeric_only=True), inplace=True)
-        data2.fillna(data2.median(numeric_only=True), inplace=True)
+def correlation_matrix(stacked, method="pearson", pairwise=None):
+    """
+    Correlation matrix of all columns of a numeric DataFrame.
+    pairwise=None picks the NaN-safe pairwise path only when the data has gaps.
+    For spearman, ranks are taken per column before any pairwise deletion.
+    """
+    if method == "spearman":
+        stacked = stacked.rank()
+    elif method != "pearson":
+        raise HTTPException(status_code=400, detail=f"Unsupported correlation method: {method}")
+
+    X = stacked.to_numpy(dtype=np.float64)
+    if pairwise is None:
+        pairwise = bool(np.isnan(X).any())
+    return pairwise_pearson_matrix(X) if pairwise else pearson_matrix(X)
+
+
+def combined_correlation(data1, data2, method="pearson", pairwise=None):
+    """Compute combined column correlations for two datasets and store results in a single dictionary"""
+    if data1 is None or data2 is None:
+        raise HTTPException(status_code=400, detail="Two datasets are required")
+
+    # Convert categorical columns to numerical using Label Encoding
+    data1 = label_encode(data1)
+    data2 = label_encode(data2)
+
+    data1.fillna(data1.median(numeric_only=True), inplace=True)
+    data2.fillna(data2.median(numeric_only=True), inplace=True)
 
-        # Calculate correlations within data1 and between data1 and data2
-        for col1 in data1.columns:
+    # One matrix for both datasets; rows missing from either side become NaN like Series.corr alignment
+    stacked = pd.concat([data1, data2], axis=1, ignore_index=True)
+    with stage("correlation_matrix", rows=len(stacked)):
+        corr = correlation_matrix(stacked, method, pairwise)
+
+    return correlation_result(corr, data1.columns, data2.columns)
+
+
+def correlation_result(corr, columns1, columns2):
+    """Nested {column: {"data1": {...}, "data2": {...}}} result from a matrix over columns1 + columns2"""
+    correlation_results = {}
+    corr = corr.tolist()
+    columns1 = list(enumerate(columns1))
+    columns2 = list(enumerate(columns2, start=len(columns1)))
+
+    # Derive the nested result shape from the matrix
+    for i, col1 in columns1:
+        correlation_results[col1] = {"data1": {}, "data2": {}}
+        for j, col2 in columns1:
+            if i != j:
+                correlation_results[col1]["data1"][col2] = corr[i][j]
+        for j, col2 in columns2:
+            correlation_results[col1]["data2"][col2] = corr[i][j]
+
+    for i, col1 in columns2:
+        if col1 not in correlation_results:
             correlation_results[col1] = {"data1": {}, "data2": {}}
-            for col2 in data1.columns:
-                if col1 == col2:
-                    continue
-                correlation = data1[col1].corr(data1[col2])
-                correlation_results[col1]["data1"][col2] = json_friendly(correlation)
-
-            for col2 in data2.columns:
-                correlation = data1[col1].corr(data2[col2])
-                correlation_results[col1]["data2"][col2] = json_friendly(correlation)
-
-        for col1 in data2.columns:
-            if col1 not in correlation_results:
-                correlation_results[col1] = {"data1": {}, "data2": {}}
-            for col2 in data2.columns:
-                if col1 == col2:
-                    continue
-                correlation = data2[col1].corr(data2[col2])
-                correlation_results[col1]["data2"][col2] = json_friendly(correlation)
-
-            for col2 in data1.columns:
-                correlation = data2[col1].corr(data1[col2])
-                correlation_results[col1]["data1"][col2] = json_friendly(correlation)
-
-        return correlation_results
+        for j, col2 in columns2:
+            if i != j:
+                correlation_results[col1]["data2"][col2] = corr[i][j]
+        for j, col2 in columns1:
+            correlation_results[col1]["data1"][col2] = corr[i][j]
+
+    return correlation_results
+
+
+def ml_correlation_csv(content1, content2, max_workers=None, max_rows=None, sample_size=None, stratify=None, confidence=CONFIDENCE, progress=None):
+    """ml_combined_correlation of two raw CSV uploads; the /jobs/ml-correlation/ job body, run in a pool worker"""
+    return ml_combined_correlation(load_csv(content1), load_csv(content2), max_workers=max_workers, max_rows=max_rows, progress=progress, sample_size=sample_size, stratify=stratify, confidence=confidence)
@@ -1,55 +1,207 @@
-import sqlite3
 import pandas as pd
 from fastapi import FastAPI, HTTPException
-from utils.helpers import json_friendly
+from utils.helpers import list_user_tables, quote_identifier
+from utils.cache import result_cache, cache_key, table_versions
+from utils.db import read_connection, write_connection
+from utils.columnar import read_columnar
+from utils.frames import optimize_dtypes
+from utils.metrics import stage
+from utils.parallel import map_ordered, worker_count
+from models import stats_catalog
+from models.profile import profile_table
+from models.preview import CONFIDENCE, needs_confirmation, preview_profile
+from utils.sampling import sample_table
 
 app = FastAPI()
-DATABASE = "database.db"
 
-def get_db_connection():
-    return sqlite3.connect(DATABASE)
-
-def get_data_from_table(table_name):
-    """Fetch data from a specific table in the SQLite3 database."""
-    conn = get_db_connection()
-    query = f"SELECT * FROM {table_name}"
-    data = pd.read_sql_query(query, conn)
-    conn.close()
+def get_data_from_table(table_name, columns=None):
+    """
+    Fetch data from a specific table, from its memory-mapped columnar copy when that
+    is current and from the SQLite3 database otherwise.
+    """
+    with stage("load_table") as current, read_connection() as conn:
+        version = table_versions(conn, [table_name])[table_name]
+        data = read_columnar(table_name, version, columns)
+        if data is None:
+            selected = ", ".join(quote_identifier(col) for col in columns) if columns is not None else "*"
+            # The catalog's distinct counts decide which text columns become categoricals
+            profile = stats_catalog.catalog_profile(conn, table_name)
+            distinct = {col: stats["distinct_count"] for col, stats in profile["columns"].items()} if profile else None
+            data = optimize_dtypes(pd.read_sql_query(f"SELECT {selected} FROM {quote_identifier(table_name)}", conn), distinct)
+        current.rows = len(data)
     return data
 
-def data_quality(table_names=None):
-    """Compute data quality metrics for specified tables or all tables in the database."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
-    if table_names:
-        tables = table_names
-    else:
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-        tables = [row[0] for row in cursor.fetchall()]
-    
-    conn.close()
+def percentage(value, total):
+    """value / total as a percentage, NaN for empty tables like the pandas division it replaces"""
+    return value / total * 100 if total else float("nan")
+
+def metrics_from_profile(profile):
+    """Build the data quality metrics from a table profile (see models/profile.py)"""
+    total_rows = profile["row_count"]
+    columns = profile["columns"]
+    duplicate_rows = profile["duplicate_rows"]
+
+    return {
+        "missing_values": {col: stats["null_count"] for col, stats in columns.items()},
+        "duplicate_rows": duplicate_rows,
+        "null_values_percentage": {col: percentage(stats["null_count"], total_rows) for col, stats in columns.items()},
+        "duplicate_percentage": percentage(duplicate_rows, total_rows),
+        "completeness_percentage": {col: 100 - percentage(stats["null_count"], total_rows) for col, stats in columns.items()},
+        "uniqueness_percentage": {col: percentage(stats["distinct_count"], total_rows) for col, stats in columns.items()},
+    }
+
+def profile_table_sql(conn, table_name):
+    """
+    Null, distinct and duplicate counts computed inside SQLite with aggregate queries,
+    in the same shape as models.profile.profile_table, without loading any rows.
+    """
+    table = quote_identifier(table_name)
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if not columns:
+        raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+
+    quoted = [quote_identifier(col) for col in columns]
+    aggregates = ", ".join(f"COUNT({col}), COUNT(DISTINCT {col})" for col in quoted)
+    with stage("sql_profile") as current:
+        counts = conn.execute(f"SELECT COUNT(*), {aggregates} FROM {table}").fetchone()
+        row_count = current.rows = counts[0]
+
+        # GROUP BY treats NULLs as equal, like DataFrame.duplicated
+        duplicate_rows = conn.execute(
+            f"SELECT COALESCE(SUM(cnt - 1), 0) FROM "
+            f"(SELECT COUNT(*) AS cnt FROM {table} GROUP BY {', '.join(quoted)} HAVING COUNT(*) > 1)"
+        ).fetchone()[0]
+
+    return {
+        "row_count": row_count,
+        "duplicate_rows": duplicate_rows,
+        "columns": {
+            col: {
+                "null_count": row_count - counts[1 + 2 * i],
+                "distinct_count": counts[2 + 2 * i],
+            }
+            for i, col in enumerate(columns)
+        },
+    }
+
+def scan_table_metrics(table, pushdown=False, workers=None):
+    """Metrics of one table from a full scan, in SQLite with pushdown=True; also the worker entry point"""
+    if pushdown:
+        with read_connection() as conn:
+            return metrics_from_profile(profile_table_sql(conn, table))
+    return metrics_from_profile(profile_table(get_data_from_table(table), workers=workers))
+
+def rescan_table_metrics(table, workers=None):
+    """Metrics of one table from a full scan whose rows also rebuild its catalog entry, so the table is read once"""
+    data = get_data_from_table(table)
+    with write_connection() as conn:
+        stats_catalog.rebuild_table_stats(conn, table, data)
+    return metrics_from_profile(profile_table(data, workers=workers))
+
+def preview_table_metrics(table, sample_size, confidence=CONFIDENCE):
+    """
+    Metrics of one table estimated from a sample of `sample_size` rows drawn by rowid,
+    with their confidence intervals and the conclusions a full scan has to confirm
+    """
+    with read_connection() as conn:
+        if not conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall():
+            raise HTTPException(status_code=404, detail=f"Table not found: {table}")
+        sample, rows = sample_table(conn, table, sample_size)
+    profile = preview_profile(sample, rows, confidence, method="rowid")
+
+    total_rows = profile["row_count"]
+    columns = profile["columns"]
+    metrics = metrics_from_profile(profile)
+    metrics["intervals"] = {
+        "duplicate_percentage": [percentage(v, total_rows) for v in profile["intervals"]["duplicate_rows"]],
+        "null_values_percentage": {col: [percentage(v, total_rows) for v in stats["intervals"]["null_count"]] for col, stats in columns.items()},
+        "uniqueness_percentage": {col: [percentage(v, total_rows) for v in stats["intervals"]["distinct_count"]] for col, stats in columns.items()},
+    }
+    metrics["preview"] = profile["sample"]
+    metrics["needs_confirmation"] = needs_confirmation(profile)
+    return metrics
+
+def estimated_cells(conn, table):
+    """Rows times columns from the largest rowid, without counting the rows"""
+    rows = conn.execute(f"SELECT MAX(rowid) FROM {quote_identifier(table)}").fetchone()[0] or 0
+    return rows * len(conn.execute(f"PRAGMA table_info({quote_identifier(table)})").fetchall())
+
+def scan_tables(tables, pushdown=False, workers=None):
+    """
+    scan_table_metrics for each table, in order. Several large tables are scanned on
+    separate worker processes, which read them from the database themselves; a single
+    table is profiled here, fanning out over its columns instead.
+    """
+    if len(tables) > 1:
+        with read_connection() as conn:
+            cells = sum(estimated_cells(conn, table) for table in tables)
+        if worker_count(cells, workers) > 1:
+            return map_ordered([(scan_table_metrics, table, pushdown, 1) for table in tables])
+    return [scan_table_metrics(table, pushdown, workers) for table in tables]
+
+def data_quality(table_names=None, use_cache=True, pushdown=False, rescan=False, workers=None, sample_size=None, confidence=CONFIDENCE):
+    """
+    Compute data quality metrics for specified tables or all tables in the database.
+    Tables ingested through /upload-csv/ are answered from the incremental statistics
+    catalog; those answers are flagged "approximate", as distinct counts there are
+    HyperLogLog estimates. Other tables, or all of them with rescan=True, are scanned in
+    full; a rescan also rebuilds their catalog entry from the rows it read.
+    With pushdown=True the catalog is bypassed and the full scan runs inside SQLite,
+    so no rows are loaded into pandas; it cannot be combined with a rescan.
+    Full scans use up to `workers` processes (default ANALYSIS_WORKERS), one per table.
+    With sample_size set every table is previewed instead: its metrics are estimated
+    from that many sampled rows, with intervals at the given confidence; the full-scan
+    options (pushdown, rescan, workers) are rejected with it.
+    """
+    if sample_size and (pushdown or rescan or workers is not None):
+        raise HTTPException(status_code=400, detail="A preview (sample_size) cannot be combined with pushdown, rescan or workers, which apply to full scans")
+    if pushdown and rescan:
+        raise HTTPException(status_code=400, detail="A rescan rebuilds the catalog from the loaded rows and cannot be pushed down")
+
+    with read_connection() as conn:
+        if table_names:
+            tables = table_names
+        else:
+            tables = list_user_tables(conn)
     
-    def compute_metrics(data):
-        total_rows = len(data)
-        missing_values = data.isnull().sum().to_dict()
-        duplicate_rows = data.duplicated().sum()
-        completeness = (1 - data.isnull().mean()).to_dict()
-        uniqueness = data.nunique().to_dict()
-        
-        return {
-            "missing_values": {col: json_friendly(value) for col, value in missing_values.items()},
-            "duplicate_rows": json_friendly(duplicate_rows),
-            "null_values_percentage": {col: json_friendly(value / total_rows * 100) for col, value in missing_values.items()},
-            "duplicate_percentage": json_friendly(duplicate_rows / total_rows * 100),
-            "completeness_percentage": {col: json_friendly(value * 100) for col, value in completeness.items()},
-            "uniqueness_percentage": {col: json_friendly(value / total_rows * 100) for col, value in uniqueness.items()},
-        }
+        # Results are cached per table and data version, so a re-upload invalidates them
+        versions = table_versions(conn, tables)
     
     results = {}
+    if sample_size:
+        for table in tables:
+            key = cache_key("data-quality-preview", table, versions[table], sample_size, confidence)
+            metrics = result_cache.get(key) if use_cache else None
+            if metrics is None:
+                metrics = preview_table_metrics(table, sample_size, confidence)
+                result_cache.set(key, metrics, tags=[table])
+            results[table] = metrics
+        return results
+
+    pending = []  # (table, cache key) of the tables that need a full scan
     for table in tables:
-        data = get_data_from_table(table)
-        results[table] = compute_metrics(data)
+        key = cache_key("data-quality", table, versions[table])
+        if rescan:
+            results[table] = rescan_table_metrics(table, workers)
+            result_cache.set(key, results[table], tags=[table])
+            continue
+
+        if not pushdown:
+            with read_connection() as conn:
+                profile = stats_catalog.catalog_profile(conn, table)
+            if profile is not None:
+                results[table] = {**metrics_from_profile(profile), "approximate": True}
+                continue
+
+        metrics = result_cache.get(key) if use_cache else None
+        if metrics is None:
+            pending.append((table, key))
+        results[table] = metrics
+
+    scanned = scan_tables([table for table, _ in pending], pushdown, workers)
+    for (table, key), metrics in zip(pending, scanned):
+        result_cache.set(key, metrics, tags=[table])
+        results[table] = metrics
     
     return results
 @app.get("/data-quality")
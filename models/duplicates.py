@@ -0,0 +1,335 @@
+# models/duplicates.py
+import io
+import json
+import sqlite3
+from itertools import repeat
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from utils.cache import table_versions
+from utils.db import read_connection, write_connection
+from utils.helpers import quote_identifier
+from utils.metrics import stage
+
+# Exact duplicates: one 64-bit fingerprint per distinct row, with the row it first appeared in.
+# Filled at ingest by the statistics catalog (models/stats_catalog.py), which counts duplicates with it.
+FINGERPRINTS_TABLE = "_profile_row_hashes"
+LOOKUP_BATCH = 50_000  # fingerprints looked up per query
+CSV_CHUNK_ROWS = 100_000
+SAMPLE_SIZE = 10  # duplicate pairs reported
+
+# Near duplicates: MinHash signatures of shingled record text, bucketed by LSH bands
+NEAR_INDEXES_TABLE = "_near_duplicate_indexes"
+NEAR_BUCKETS_TABLE = "_near_duplicate_buckets"
+NEAR_SIGNATURES_TABLE = "_near_duplicate_signatures"
+SHINGLE_SIZE = 3  # characters per shingle
+LSH_BANDS = 16
+LSH_ROWS = 4  # signature values per band; pairs above ~(1/16)^(1/4) = 0.5 Jaccard become candidates
+MINHASH_SEED = 42
+MAX_BUCKET_ROWS = 100  # larger buckets (mass-repeated text) are skipped instead of paired quadratically
+NEAR_THRESHOLD = 0.8  # default estimated Jaccard similarity of reported pairs
+INDEX_CHUNK_ROWS = 50_000
+
+
+def ensure_fingerprints(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {FINGERPRINTS_TABLE} "
+        "(table_name TEXT, row_hash INTEGER, first_row INTEGER, PRIMARY KEY (table_name, row_hash)) WITHOUT ROWID"
+    )
+
+
+def value_hashes(series):
+    """
+    uint64 hash of every value of a column. Whole numbers are hashed as int64 whether
+    the column holds integers or, because of a missing value, floats; other numbers as
+    float64. Integers are never cast to float64, so distinct values beyond 2**53 keep
+    distinct hashes.
+    """
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        return pd.util.hash_pandas_object(series, index=False).to_numpy()
+    if pd.api.types.is_integer_dtype(series):
+        missing = series.isna().to_numpy()
+        hashes = pd.util.hash_array(series.to_numpy(dtype=np.int64, na_value=0))
+        return np.where(missing, pd.util.hash_array(np.array([np.nan]))[0], hashes) if missing.any() else hashes
+    values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+    with np.errstate(invalid="ignore"):
+        whole = np.isfinite(values) & (values == np.floor(values)) & (np.abs(values) < 2.0 ** 63)
+    return np.where(whole, pd.util.hash_array(np.where(whole, values, 0).astype(np.int64)), pd.util.hash_array(values))
+
+
+def row_fingerprints(df):
+    """
+    64-bit fingerprint of every row as int64 (SQLite's integer type), combined from the
+    value_hashes of its columns so a row fingerprints the same however its chunk was parsed
+    """
+    hashes = pd.DataFrame({col: value_hashes(df[col]) for col in df.columns}, index=df.index)
+    return pd.util.hash_pandas_object(hashes, index=False).to_numpy().view(np.int64)
+
+
+def record_fingerprints(conn, table_name, fingerprints, first_row):
+    """
+    Add the fingerprints of rows numbered first_row, first_row + 1, ... to the index and
+    return how many of them duplicate a row indexed before (or earlier in the same batch)
+    """
+    before = conn.total_changes
+    conn.executemany(
+        f"INSERT OR IGNORE INTO {FINGERPRINTS_TABLE} (table_name, row_hash, first_row) VALUES (?, ?, ?)",
+        zip(repeat(table_name), fingerprints.tolist(), range(first_row, first_row + len(fingerprints))),
+    )
+    return len(fingerprints) - (conn.total_changes - before)
+
+
+def lookup_fingerprints(conn, table_name, fingerprints):
+    """Row number of the indexed row each fingerprint matches, -1 for none; one index probe per distinct fingerprint"""
+    unique, inverse = np.unique(fingerprints, return_inverse=True)
+    found = np.full(len(unique), -1, dtype=np.int64)
+    for start in range(0, len(unique), LOOKUP_BATCH):
+        batch = unique[start:start + LOOKUP_BATCH]
+        matches = conn.execute(
+            f"SELECT row_hash, first_row FROM {FINGERPRINTS_TABLE} "
+            "WHERE table_name = ? AND row_hash IN (SELECT value FROM json_each(?))",
+            (table_name, json.dumps(batch.tolist())),
+        ).fetchall()
+        if matches:
+            hashes, rows = np.array(matches, dtype=np.int64).T
+            found[start + np.searchsorted(batch, hashes)] = rows
+    return found[inverse]
+
+
+def check_duplicates(conn, table_name, chunks, sample_size=SAMPLE_SIZE):
+    """
+    Rows of new data (DataFrame chunks with the table's columns) that already exist in a
+    stored table or repeat an earlier new row. Only fingerprints are kept and the table
+    is probed through its fingerprint index, so the cost is O(new rows). Row numbers are
+    0-based, in the table and in the new data respectively.
+    """
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()]
+    if not columns:
+        raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+    index_columns = [row[1] for row in conn.execute(f"PRAGMA table_info({FINGERPRINTS_TABLE})").fetchall()]
+    indexed = "first_row" in index_columns and conn.execute(
+        f"SELECT 1 FROM {FINGERPRINTS_TABLE} WHERE table_name = ? LIMIT 1", (table_name,)
+    ).fetchone() is not None
+    if not indexed and conn.execute(f"SELECT 1 FROM {quote_identifier(table_name)} LIMIT 1").fetchone() is not None:
+        raise HTTPException(status_code=409, detail=f"{table_name} has no fingerprint index; rebuild it with /data-quality?rescan=true")
+
+    with stage("fingerprint") as current:
+        parts = []
+        for chunk in chunks:
+            missing = set(columns) - set(chunk.columns)
+            if missing:
+                raise HTTPException(status_code=400, detail=f"Columns missing for {table_name}: {', '.join(sorted(missing))}")
+            parts.append(row_fingerprints(chunk[columns]))
+        fingerprints = np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+        current.rows = len(fingerprints)
+
+    with stage("fingerprint_lookup", rows=len(fingerprints)):
+        existing = lookup_fingerprints(conn, table_name, fingerprints)
+    # Within the new data, a row repeats the first new row with its fingerprint;
+    # factorize numbers fingerprints in order of appearance
+    codes, _ = pd.factorize(fingerprints)
+    first_new = np.unique(codes, return_index=True)[1]
+    repeats = (first_new[codes] != np.arange(len(codes))) & (existing < 0)
+
+    in_table = np.flatnonzero(existing >= 0)
+    in_new = np.flatnonzero(repeats)
+    sample = [{"row": int(row), "duplicate_of": int(existing[row]), "in": "table"} for row in in_table[:sample_size]]
+    sample += [{"row": int(row), "duplicate_of": int(first_new[codes[row]]), "in": "new"} for row in in_new[:sample_size]]
+    return {
+        "rows": len(fingerprints),
+        "duplicates_of_table": len(in_table),
+        "duplicates_within_new": len(in_new),
+        "new_unique_rows": len(fingerprints) - len(in_table) - len(in_new),
+        "sample": sample,
+    }
+
+
+def check_csv_duplicates(content, table_name, sample_size=SAMPLE_SIZE):
+    """check_duplicates for raw CSV bytes, parsed in chunks; runs in a thread, as its errors are HTTPExceptions"""
+    with read_connection() as conn:
+        return check_duplicates(conn, table_name, pd.read_csv(io.BytesIO(content), chunksize=CSV_CHUNK_ROWS), sample_size)
+
+
+def record_text(df, columns):
+    """Record text of the given columns: lower-cased, whitespace collapsed, nulls empty"""
+    parts = [
+        df[col].astype("string").fillna("").str.lower().str.replace(r"\s+", " ", regex=True).str.strip()
+        for col in columns
+    ]
+    return parts[0].str.cat(parts[1:], sep=" ") if len(parts) > 1 else parts[0]
+
+
+def _hash_parameters():
+    rng = np.random.default_rng(MINHASH_SEED)
+    multipliers = rng.integers(1, np.iinfo(np.int64).max, LSH_BANDS * LSH_ROWS, dtype=np.uint64) | np.uint64(1)
+    offsets = rng.integers(0, np.iinfo(np.int64).max, LSH_BANDS * LSH_ROWS, dtype=np.uint64)
+    return multipliers, offsets
+
+
+def minhash_signatures(texts):
+    """
+    MinHash signature (LSH_BANDS * LSH_ROWS uint64 values) of the character shingles of
+    each text, with one multiply-add permutation of the shingle hashes per value.
+    Returns (positions of the non-empty texts, signatures).
+    """
+    texts = np.asarray(texts, dtype=object)
+    positions = np.flatnonzero([len(text) > 0 for text in texts])
+    shingles, counts = [], []
+    for text in texts[positions]:
+        grams = [text[i:i + SHINGLE_SIZE] for i in range(max(len(text) - SHINGLE_SIZE + 1, 1))]
+        shingles.extend(grams)
+        counts.append(len(grams))
+    signatures = np.empty((len(positions), LSH_BANDS * LSH_ROWS), dtype=np.uint64)
+    if not len(positions):
+        return positions, signatures
+
+    hashes = pd.util.hash_array(np.asarray(shingles, dtype=object))
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    multipliers, offsets = _hash_parameters()
+    with np.errstate(over="ignore"):
+        for i, (multiplier, offset) in enumerate(zip(multipliers, offsets)):
+            signatures[:, i] = np.minimum.reduceat(hashes * multiplier + offset, starts)
+    return positions, signatures
+
+
+def band_buckets(signatures):
+    """Bucket id (int64) of every signature in each LSH band, shape (rows, LSH_BANDS)"""
+    multipliers, _ = _hash_parameters()
+    banded = signatures.reshape(len(signatures), LSH_BANDS, LSH_ROWS)
+    with np.errstate(over="ignore"):
+        return (banded * multipliers[:LSH_ROWS]).sum(axis=2, dtype=np.uint64).view(np.int64)
+
+
+def ensure_near_index(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {NEAR_INDEXES_TABLE} "
+        "(table_name TEXT PRIMARY KEY, columns TEXT NOT NULL, version INTEGER NOT NULL)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {NEAR_BUCKETS_TABLE} "
+        "(table_name TEXT, band INTEGER, bucket INTEGER, row_id INTEGER, "
+        "PRIMARY KEY (table_name, band, bucket, row_id)) WITHOUT ROWID"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {NEAR_SIGNATURES_TABLE} "
+        "(table_name TEXT, row_id INTEGER, signature BLOB NOT NULL, PRIMARY KEY (table_name, row_id)) WITHOUT ROWID"
+    )
+
+
+def near_index_current(conn, table_name, columns, version):
+    """True if the stored near-duplicate index covers these columns of this table version"""
+    try:
+        row = conn.execute(f"SELECT columns, version FROM {NEAR_INDEXES_TABLE} WHERE table_name = ?", (table_name,)).fetchone()
+    except sqlite3.OperationalError:
+        # No index built yet
+        return False
+    return row is not None and json.loads(row[0]) == list(columns) and row[1] == version
+
+
+def build_near_index(conn, table_name, columns, version, chunk_size=INDEX_CHUNK_ROWS):
+    """
+    Rebuild the near-duplicate index of a table in one streaming pass over the given
+    columns. Rows are indexed by their SQLite rowid, which deleted rows leave gaps in.
+    """
+    ensure_near_index(conn)
+    for index_table in (NEAR_INDEXES_TABLE, NEAR_BUCKETS_TABLE, NEAR_SIGNATURES_TABLE):
+        conn.execute(f"DELETE FROM {index_table} WHERE table_name = ?", (table_name,))
+
+    selected = ", ".join(quote_identifier(col) for col in columns)
+    indexed = 0
+    with stage("near_duplicate_index") as current:
+        for chunk in pd.read_sql_query(f"SELECT rowid, {selected} FROM {quote_identifier(table_name)} ORDER BY rowid", conn, chunksize=chunk_size):
+            positions, signatures = minhash_signatures(record_text(chunk, columns).to_numpy())
+            rows = chunk.iloc[:, 0].to_numpy()[positions].tolist()
+            buckets = band_buckets(signatures)
+            conn.executemany(
+                f"INSERT OR IGNORE INTO {NEAR_BUCKETS_TABLE} (table_name, band, bucket, row_id) VALUES (?, ?, ?, ?)",
+                ((table_name, band, bucket, row) for band in range(LSH_BANDS) for bucket, row in zip(buckets[:, band].tolist(), rows)),
+            )
+            conn.executemany(
+                f"INSERT INTO {NEAR_SIGNATURES_TABLE} (table_name, row_id, signature) VALUES (?, ?, ?)",
+                zip(repeat(table_name), rows, (signature.tobytes() for signature in signatures)),
+            )
+            indexed += len(chunk)
+        current.rows = indexed
+    conn.execute(
+        f"INSERT INTO {NEAR_INDEXES_TABLE} (table_name, columns, version) VALUES (?, ?, ?)",
+        (table_name, json.dumps(list(columns)), version),
+    )
+
+
+def near_duplicate_pairs(conn, table_name, columns, threshold=NEAR_THRESHOLD, limit=100):
+    """
+    Pairs of rows whose record text has an estimated Jaccard similarity of at least
+    threshold, most similar first, with the values of both records. Candidates are the
+    rows sharing an LSH bucket; their similarity is the share of equal signature values.
+    Rows are reported as rowid - 1, the row number for tables that are only ever appended to.
+    """
+    with stage("near_duplicate_pairs") as current:
+        candidates = np.array(conn.execute(
+            f"SELECT DISTINCT a.row_id, b.row_id FROM {NEAR_BUCKETS_TABLE} a "
+            f"JOIN {NEAR_BUCKETS_TABLE} b ON b.table_name = a.table_name AND b.band = a.band AND b.bucket = a.bucket "
+            f"AND b.row_id > a.row_id "
+            f"WHERE a.table_name = ? AND (a.band, a.bucket) IN ("
+            f"SELECT band, bucket FROM {NEAR_BUCKETS_TABLE} WHERE table_name = ? GROUP BY band, bucket "
+            f"HAVING COUNT(*) BETWEEN 2 AND ?)",
+            (table_name, table_name, MAX_BUCKET_ROWS),
+        ).fetchall(), dtype=np.int64).reshape(-1, 2)
+        current.rows = len(candidates)
+        if not len(candidates):
+            return {"candidates": 0, "pairs": []}
+
+        involved = np.unique(candidates)
+        signatures = {}
+        for start in range(0, len(involved), LOOKUP_BATCH):
+            signatures.update(conn.execute(
+                f"SELECT row_id, signature FROM {NEAR_SIGNATURES_TABLE} "
+                "WHERE table_name = ? AND row_id IN (SELECT value FROM json_each(?))",
+                (table_name, json.dumps(involved[start:start + LOOKUP_BATCH].tolist())),
+            ).fetchall())
+        matrix = np.stack([np.frombuffer(signatures[row], dtype=np.uint64) for row in involved.tolist()])
+        left, right = np.searchsorted(involved, candidates[:, 0]), np.searchsorted(involved, candidates[:, 1])
+        similarity = (matrix[left] == matrix[right]).mean(axis=1)
+
+        keep = np.flatnonzero(similarity >= threshold)
+        keep = keep[np.argsort(-similarity[keep], kind="stable")][:limit]
+
+    rows = np.unique(candidates[keep])
+    selected = ", ".join(quote_identifier(col) for col in columns)
+    records = {}
+    for start in range(0, len(rows), LOOKUP_BATCH):
+        records.update(
+            (rowid, dict(zip(columns, values))) for rowid, *values in conn.execute(
+                f"SELECT rowid, {selected} FROM {quote_identifier(table_name)} WHERE rowid IN (SELECT value FROM json_each(?))",
+                (json.dumps(rows[start:start + LOOKUP_BATCH].tolist()),),
+            )
+        )
+    return {
+        "candidates": len(candidates),
+        "pairs": [
+            {
+                "rows": [int(a) - 1, int(b) - 1],
+                "similarity": round(float(similarity[i]), 4),
+                "records": [records.get(int(a)), records.get(int(b))],
+            }
+            for i, (a, b) in zip(keep, candidates[keep])
+        ],
+    }
+
+
+def near_duplicates(table_name, columns, threshold=NEAR_THRESHOLD, limit=100):
+    """Near-duplicate pairs of a stored table, (re)building its index first when stale"""
+    with read_connection() as conn:
+        existing = [row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table_name)})").fetchall()]
+        if not existing:
+            raise HTTPException(status_code=404, detail=f"Table not found: {table_name}")
+        unknown = [col for col in columns if col not in existing]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown columns for {table_name}: {', '.join(unknown)}")
+        version = table_versions(conn, [table_name])[table_name]
+        current = near_index_current(conn, table_name, columns, version)
+    if not current:
+        with write_connection() as conn:
+            build_near_index(conn, table_name, columns, version)
+    with read_connection() as conn:
+        return near_duplicate_pairs(conn, table_name, columns, threshold, limit)
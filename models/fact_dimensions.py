@@ -2,19 +2,29 @@ from fastapi import FastAPI, UploadFile, File
 import pandas as pd
 import io
 import json
+from models.profile import profile_tables
+from models.inclusion_dependencies import discover_inclusion_dependencies
 
 app = FastAPI()
 
-def detect_fact_dimension(tables):
-    """Classifies tables as Fact or Dimension based on dependencies."""
+def detect_fact_dimension(tables, profiles=None, approx_error=None, inclusion=False, min_containment=0.9):
+    """
+    Classifies tables as Fact or Dimension based on dependencies.
+    With inclusion=True a table is a dimension only if another table's column values
+    are actually contained in one of its PKs. Without it, precomputed profiles are
+    enough and tables may be None.
+    """
     table_info = {}
+    if profiles is None:
+        profiles = profile_tables(tables, approx_error)
 
     # Extract column information for each table
-    for name, df in tables.items():
+    for name, profile in profiles.items():
+        columns = profile["columns"]
         table_info[name] = {
-            "columns": list(df.columns),
-            "unique_counts": {col: df[col].nunique() for col in df.columns},
-            "row_count": len(df)
+            "columns": list(columns),
+            "unique_counts": {col: stats["distinct_count"] for col, stats in columns.items()},
+            "row_count": profile["row_count"]
         }
 
     # Identify Primary Keys (PKs)
@@ -38,8 +48,20 @@ def detect_fact_dimension(tables):
     dimension_tables = []
     pk_to_table = {pk: name for name, pks in pk_candidates.items() for pk in pks}  # Map PKs to tables
 
+    referenced_tables = set()
+    if inclusion:
+        discovered = discover_inclusion_dependencies(tables, profiles, min_containment)
+        referenced_tables = {
+            dep["to_table"] for dep in discovered["inclusion_dependencies"] if dep["from_table"] != dep["to_table"]
+        }
+
     for name, pks in pk_candidates.items():
-        if any(pk in fk_candidates.get(other, []) for other, other_pks in pk_candidates.items() if other != name for pk in pks):
+        if inclusion:
+            if name in referenced_tables:
+                dimension_tables.append(name)
+            else:
+                fact_tables.append(name)
+        elif any(pk in fk_candidates.get(other, []) for other, other_pks in pk_candidates.items() if other != name for pk in pks):
             dimension_tables.append(name)  # If its PK is an FK in another table, it's a dimension
         else:
             fact_tables.append(name)  # If it does not depend on any other table, it's a fact table
@@ -2,16 +2,104 @@ from fastapi import FastAPI, HTTPException, UploadFile, File
 import pandas as pd  # Add this import statement for pandas
 import numpy as np
 import io
+from pandas.tseries.api import guess_datetime_format
 from utils.helpers import json_friendly
+from utils.metrics import stage
+
+DATE_SAMPLE_SIZE = 100  # values checked before a column is parsed in full
+DATE_LIKE_PATTERN = r"^\s*(\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}|\d{8}T?\d*)"
+# Tried in order when the format cannot be guessed from the first value
+DATE_FORMATS = [
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S", "%Y-%m-%d %H:%M", "%Y/%m/%d",
+    "%m/%d/%Y", "%d/%m/%Y", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M", "%d.%m.%Y", "%m-%d-%Y", "%d-%m-%Y",
+]
+
+
+def sample_values(series, size=DATE_SAMPLE_SIZE):
+    """Evenly spaced non-null values, so sorted or clustered columns are still covered"""
+    non_null = series.dropna()
+    if len(non_null) <= size:
+        return non_null
+    return non_null.iloc[np.linspace(0, len(non_null) - 1, size).astype(int)]
+
+
+def infer_date_format(sample):
+    """A single strptime format that parses every sampled value, or None"""
+    candidates = [guess_datetime_format(sample.iloc[0]), guess_datetime_format(sample.iloc[0], dayfirst=True)]
+    for fmt in dict.fromkeys(c for c in candidates + DATE_FORMATS if c):
+        if pd.to_datetime(sample, format=fmt, errors="coerce").notna().all():
+            return fmt
+    return None
+
+
+def time_grain(dates):
+    """Coarsest calendar unit all timestamps are aligned to"""
+    if (dates.dt.second != 0).any() or (dates.dt.microsecond != 0).any():
+        return "secondly"
+    if (dates.dt.minute != 0).any():
+        return "minutely"
+    if (dates.dt.hour != 0).any():
+        return "hourly"
+    if (dates.dt.day != 1).any():
+        steps = np.diff(np.unique(dates.to_numpy())) // np.timedelta64(1, "D")
+        return "weekly" if len(steps) and (steps % 7 == 0).all() else "daily"
+    if (dates.dt.month != 1).any():
+        return "monthly"
+    return "yearly"
+
+
+def detect_date_column(series):
+    """
+    Details of a column whose values are all dates, else None. Numeric columns are skipped
+    and text columns must look like dates on a sample before the full column is parsed
+    with one fixed format. Categoricals (low-cardinality text as loaded by optimize_dtypes
+    or the columnar copy) are checked on the categories they use, one parse per value.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        if (codes < 0).any() or pd.api.types.is_numeric_dtype(series.cat.categories):
+            return None
+        used = np.bincount(codes, minlength=len(series.cat.categories)) > 0
+        return detect_date_column(pd.Series(series.cat.categories[used]).astype(str))
+    if pd.api.types.is_datetime64_any_dtype(series):
+        dates, fmt = series, None
+    elif pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+        if series.isna().any():
+            return None
+        sample = sample_values(series).astype(str)
+        if sample.empty or not sample.str.match(DATE_LIKE_PATTERN).all():
+            return None
+        fmt = infer_date_format(sample)
+        if fmt is None:
+            return None
+        dates = pd.to_datetime(series, format=fmt, errors="coerce")
+    else:
+        return None
+
+    if dates.empty or dates.isna().any():
+        return None
+    return {
+        "format": fmt,
+        "min": dates.min().isoformat(),
+        "max": dates.max().isoformat(),
+        "grain": time_grain(dates),
+    }
+
 
 def analyze_granularity(data):
     """Analyze dataset granularity (rows, columns, date detection)"""
     if data is None:
         raise HTTPException(status_code=400, detail="No data uploaded")
-    
-    date_columns = [col for col in data.columns if pd.to_datetime(data[col], errors="coerce").notna().all()]
+
+    date_details = {}
+    with stage("date_detection", rows=len(data)):
+        for col in data.columns:
+            details = detect_date_column(data[col])
+            if details is not None:
+                date_details[col] = details
     return {
         "rows": json_friendly(len(data)),
         "columns": json_friendly(len(data.columns)),
-        "date_columns": json_friendly(date_columns),
-    }
\ No newline at end of file
+        "date_columns": json_friendly(list(date_details)),
+        "date_details": date_details,
+    }
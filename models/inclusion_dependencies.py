@@ -0,0 +1,115 @@
+# models/inclusion_dependencies.py
+import numpy as np
+import pandas as pd
+from models.profile import profile_tables
+from utils.metrics import stage
+
+SAMPLE_SIZE = 256  # FK values probed before testing a pair in full
+EARLY_REJECT_MARGIN = 0.1  # ~5 standard errors of the sampled containment at SAMPLE_SIZE
+
+
+def value_kind(dtype):
+    """Coarse type family used to prune column pairs that can never match"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    return "text"
+
+
+def build_value_index(series):
+    """Hashed index over the distinct non-null values of a key column, built once and reused"""
+    return pd.Index(pd.unique(series.dropna()))
+
+
+def column_values(series):
+    """Distinct non-null values of a column, how many rows hold each, and a fixed probe sample"""
+    codes, uniques = pd.factorize(series)
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    sample = None
+    if len(uniques) > SAMPLE_SIZE:
+        positions = np.random.default_rng(0).choice(len(uniques), SAMPLE_SIZE, replace=False)
+        sample = uniques[np.sort(positions)]
+    return uniques, counts, sample
+
+
+def ranges_overlap(fk_stats, pk_stats):
+    """False when the min/max ranges prove that no FK value can be in the PK"""
+    try:
+        return not (fk_stats["max"] < pk_stats["min"] or fk_stats["min"] > pk_stats["max"])
+    except TypeError:
+        # Bounds missing or not comparable; fall back to testing the pair
+        return True
+
+
+def discover_inclusion_dependencies(tables, profiles=None, min_containment=0.9, min_distinct=2):
+    """
+    Find columns whose values are (mostly) contained in a unique column of another table.
+    Containment is the share of the FK column's distinct values found in the PK column;
+    row_containment is the share of its non-null rows.
+    """
+    profiles = profiles or profile_tables(tables)
+
+    # Candidate PKs and their value indexes
+    pk_columns = [
+        (name, col) for name, profile in profiles.items()
+        for col, stats in profile["columns"].items() if stats["is_unique"] and profile["row_count"]
+    ]
+    pk_indexes = {}
+    fk_values = {}
+    tested = pruned = 0
+    dependencies = []
+
+    for fk_table, fk_profile in profiles.items():
+        for fk_col, fk_stats in fk_profile["columns"].items():
+            if fk_stats["distinct_count"] < min_distinct:
+                continue
+            for pk_table, pk_col in pk_columns:
+                if (fk_table, fk_col) == (pk_table, pk_col):
+                    continue
+                pk_stats = profiles[pk_table]["columns"][pk_col]
+
+                # Prune by type, cardinality and value range before touching any data
+                if (
+                    value_kind(tables[fk_table][fk_col].dtype) != value_kind(tables[pk_table][pk_col].dtype)
+                    or fk_stats["distinct_count"] * min_containment > pk_stats["distinct_count"]
+                    or not ranges_overlap(fk_stats, pk_stats)
+                ):
+                    pruned += 1
+                    continue
+
+                tested += 1
+                if (pk_table, pk_col) not in pk_indexes:
+                    with stage("value_index", rows=len(tables[pk_table])):
+                        pk_indexes[(pk_table, pk_col)] = build_value_index(tables[pk_table][pk_col])
+                if (fk_table, fk_col) not in fk_values:
+                    with stage("value_index", rows=len(tables[fk_table])):
+                        fk_values[(fk_table, fk_col)] = column_values(tables[fk_table][fk_col])
+
+                uniques, counts, sample = fk_values[(fk_table, fk_col)]
+                pk_index = pk_indexes[(pk_table, pk_col)]
+                if sample is not None and (pk_index.get_indexer(sample) >= 0).mean() < min_containment - EARLY_REJECT_MARGIN:
+                    continue
+
+                found = pk_index.get_indexer(uniques) >= 0
+                containment = found.mean() if len(uniques) else 0.0
+                if containment < min_containment:
+                    continue
+
+                dependencies.append({
+                    "from_table": fk_table,
+                    "foreign_key": fk_col,
+                    "to_table": pk_table,
+                    "primary_key": pk_col,
+                    "containment": float(containment),
+                    "row_containment": float(counts[found].sum() / counts.sum()),
+                    "distinct_values": int(len(uniques)),
+                })
+
+    dependencies.sort(key=lambda dep: (-dep["containment"], -dep["row_containment"]))
+    return {
+        "inclusion_dependencies": dependencies,
+        "candidate_pairs": {"tested": tested, "pruned": pruned},
+    }
@@ -0,0 +1,156 @@
+# models/preview.py
+import math
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from utils.metrics import stage
+from utils.sampling import reservoir_sample_csv
+
+CONFIDENCE = 0.95  # default confidence level of preview intervals
+DEFAULT_SAMPLE_SIZE = 10_000
+
+
+def z_score(confidence):
+    return NormalDist().inv_cdf(0.5 + confidence / 2)
+
+
+def proportion_interval(hits, n, population, confidence=CONFIDENCE):
+    """
+    Wilson score interval for a population share from `hits` out of n rows sampled
+    without replacement (the finite population correction narrows it; a full sample is exact).
+    """
+    if n == 0:
+        return 0.0, 1.0
+    share = hits / n
+    if n >= population:
+        return share, share
+    z = z_score(confidence) * math.sqrt((population - n) / (population - 1))
+    denominator = 1 + z * z / n
+    centre = (share + z * z / (2 * n)) / denominator
+    half = z * math.sqrt(share * (1 - share) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def mean_interval(values, confidence=CONFIDENCE):
+    """Normal interval for the mean of independent observations"""
+    mean = float(np.mean(values))
+    if len(values) < 2:
+        return mean, mean
+    half = z_score(confidence) * float(np.std(values, ddof=1)) / math.sqrt(len(values))
+    return mean - half, mean + half
+
+
+def distinct_estimate(non_null, population_non_null):
+    """
+    Distinct values of a column from its sampled non-null values with Haas' first-order
+    jackknife estimator d / (1 - (1 - n/N) f1 / n), where f1 counts the values seen once.
+    The range runs from the values actually seen to every singleton standing for N / n
+    values. Returns (estimate, low, high).
+    """
+    counts = non_null.value_counts(sort=False)
+    counts = counts[counts > 0]  # categoricals list unused categories
+    seen, n = len(counts), int(counts.sum())
+    if n == 0 or n >= population_non_null:
+        return seen, seen, seen
+    singletons = int((counts == 1).sum())
+    high = min(seen - singletons + singletons * population_non_null / n, population_non_null)
+    estimate = min(seen / (1 - (1 - n / population_non_null) * singletons / n), high)
+    return int(round(estimate)), seen, int(round(high))
+
+
+def duplicate_estimate(sample_duplicates, n, population, confidence=CONFIDENCE):
+    """
+    Duplicate rows of the population from those within the sample. A duplicated pair
+    lands in the sample with probability n(n-1) / N(N-1), so the sample count is scaled
+    by its inverse; the range is a Poisson interval on the sample count, and never
+    below the duplicates actually seen. Returns (estimate, low, high).
+    """
+    if n >= population or n < 2:
+        return sample_duplicates, sample_duplicates, sample_duplicates
+    scale = population * (population - 1) / (n * (n - 1))
+    z = z_score(confidence)
+    spread = z * math.sqrt(sample_duplicates)
+    low = max(sample_duplicates, (sample_duplicates - spread) * scale)
+    high = min((sample_duplicates + spread + z * z) * scale, population - 1)
+    estimate = min(max(sample_duplicates * scale, low), high)
+    return int(round(estimate)), int(math.ceil(low)), int(round(high))
+
+
+def preview_profile(sample, population, confidence=CONFIDENCE, method="uniform"):
+    """
+    A profile in the shape of models.profile.profile_table estimated from a uniform
+    sample of a table with `population` rows. Counts are point estimates with an
+    "intervals" entry per column; a column is a key candidate ("is_unique") when the
+    sample holds no nulls and no repeated value, which only a full scan can confirm.
+    """
+    n = len(sample)
+    exact = n >= population
+    with stage("preview_profile", rows=n):
+        sample_duplicates = int(pd.util.hash_pandas_object(sample, index=False).duplicated().sum()) if len(sample.columns) else 0
+        duplicates = duplicate_estimate(sample_duplicates, n, population, confidence)
+
+        columns = {}
+        for col in sample.columns:
+            series = sample[col]
+            non_null = series.dropna()
+            sample_nulls = n - len(non_null)
+            null_low, null_high = proportion_interval(sample_nulls, n, population, confidence)
+            null_count = int(round(sample_nulls / n * population)) if n else 0
+
+            is_unique = sample_nulls == 0 and non_null.is_unique
+            if is_unique:
+                distinct = (population, population if exact else len(non_null), population)
+            else:
+                distinct = distinct_estimate(non_null, population - null_count)
+
+            minimum = maximum = None
+            if len(non_null):
+                try:
+                    minimum, maximum = non_null.min(), non_null.max()
+                except TypeError:
+                    pass
+
+            columns[col] = {
+                "dtype": str(series.dtype),
+                "null_count": null_count,
+                "distinct_count": distinct[0],
+                "min": minimum,
+                "max": maximum,
+                "is_unique": is_unique,
+                "approximate": not exact,
+                "intervals": {
+                    "null_count": [int(null_low * population), int(math.ceil(null_high * population))],
+                    "distinct_count": list(distinct[1:]),
+                },
+            }
+
+    return {
+        "row_count": population,
+        "duplicate_rows": duplicates[0],
+        "columns": columns,
+        "intervals": {"duplicate_rows": list(duplicates[1:])},
+        "sample": {"rows": n, "population_rows": population, "method": method, "confidence": confidence, "exact": exact},
+    }
+
+
+def needs_confirmation(profile):
+    """Conclusions a preview profile suggests but only a full scan can establish"""
+    if profile["sample"]["exact"]:
+        return []
+    notes = [
+        {"column": col, "conclusion": "unique, primary key candidate"}
+        for col, stats in profile["columns"].items() if stats["is_unique"]
+    ]
+    notes += [
+        {"column": col, "conclusion": "no missing values"}
+        for col, stats in profile["columns"].items() if stats["null_count"] == 0
+    ]
+    if profile["duplicate_rows"] == 0:
+        notes.append({"column": None, "conclusion": "no duplicate rows"})
+    return notes
+
+
+def preview_csv(content, sample_size=DEFAULT_SAMPLE_SIZE, confidence=CONFIDENCE):
+    """Preview profile of raw CSV bytes from a reservoir sample; small enough to return from a worker process"""
+    sample, total = reservoir_sample_csv(content, sample_size)
+    return preview_profile(sample, total, confidence, method="reservoir")
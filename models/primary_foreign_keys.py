@@ -1,19 +1,27 @@
+import io
 from fastapi import HTTPException
 from utils.helpers import json_friendly
+from models.profile import profile_table, profile_tables
+from models.inclusion_dependencies import discover_inclusion_dependencies
+from models.preview import needs_confirmation
+from utils.metrics import stage
 import pandas as pd
 
-def identify_keys(data1, data2):
+def identify_keys(data1, data2, approx_error=None):
     """Identify primary and foreign key candidates for both datasets separately"""
     if data1 is None or data2 is None:
         raise HTTPException(status_code=400, detail="No data uploaded")
     
+    profile1 = profile_table(data1, approx_error=approx_error)
+    profile2 = profile_table(data2, approx_error=approx_error)
+
     # Identify primary keys (unique & NOT NULL) in both files
-    primary_keys_data1 = [col for col in data1.columns if data1[col].nunique() == len(data1) and data1[col].isna().sum() == 0]
-    primary_keys_data2 = [col for col in data2.columns if data2[col].nunique() == len(data2) and data2[col].isna().sum() == 0]
+    primary_keys_data1 = [col for col, stats in profile1["columns"].items() if stats["is_unique"]]
+    primary_keys_data2 = [col for col, stats in profile2["columns"].items() if stats["is_unique"]]
     
     # Identify potential foreign keys in both files
-    foreign_keys_data1 = [col for col in data1.columns if data1[col].nunique() < len(data1) and data1[col].nunique() > 1]
-    foreign_keys_data2 = [col for col in data2.columns if data2[col].nunique() < len(data2) and data2[col].nunique() > 1]
+    foreign_keys_data1 = [col for col, stats in profile1["columns"].items() if 1 < stats["distinct_count"] < profile1["row_count"]]
+    foreign_keys_data2 = [col for col, stats in profile2["columns"].items() if 1 < stats["distinct_count"] < profile2["row_count"]]
     
    
     finaly_foreign_key1=[]
@@ -38,19 +46,28 @@ import json
 
 app = FastAPI()
 
-def extract_pk_fk_relationships(tables):
-    """Extracts Primary and Foreign Key relationships dynamically between uploaded tables."""
+def extract_pk_fk_relationships(tables, profiles=None, approx_error=None, inclusion=False, min_containment=0.9):
+    """
+    Extracts Primary and Foreign Key relationships dynamically between uploaded tables.
+    With inclusion=True, FKs are found by checking that their values exist in the
+    referenced PK instead of by matching column names. Without it, precomputed
+    profiles are enough and tables may be None.
+    """
     table_info = {}
     pk_candidates = {}  # Store primary keys
     fk_candidates = {}  # Store foreign keys
+    # approx_error switches distinct counts to HyperLogLog sketches; key candidates are still confirmed exactly
+    if profiles is None:
+        profiles = profile_tables(tables, approx_error)
 
     # Extract column information for each table
-    for name, df in tables.items():
-        unique_counts = {col: df[col].nunique() for col in df.columns}
-        row_count = len(df)
+    for name, profile in profiles.items():
+        columns = profile["columns"]
+        unique_counts = {col: stats["distinct_count"] for col, stats in columns.items()}
+        row_count = profile["row_count"]
 
         table_info[name] = {
-            "columns": list(df.columns),
+            "columns": list(columns),
             "unique_counts": unique_counts,
             "row_count": row_count
         }
@@ -60,12 +77,15 @@ def extract_pk_fk_relationships(tables):
             col for col, unique_count in unique_counts.items() if unique_count == row_count
         ]
 
+    if inclusion:
+        return inclusion_relationships(tables, profiles, pk_candidates, min_containment)
+
     # Identify Foreign Keys (FKs)
     pk_to_table = {pk: table for table, pks in pk_candidates.items() for pk in pks}
 
-    for name, df in tables.items():
+    for name, info in table_info.items():
         fk_candidates[name] = [
-            col for col in df.columns if col in pk_to_table and pk_to_table[col] != name
+            col for col in info["columns"] if col in pk_to_table and pk_to_table[col] != name
         ]
 
     # Build Relationship Structure
@@ -86,6 +106,50 @@ def extract_pk_fk_relationships(tables):
                 "primary_key": fk
             })
 
+    # Profiles estimated from samples (see models/preview.py) only suggest their keys
+    sampled = {name: profile["sample"] for name, profile in profiles.items() if "sample" in profile}
+    if sampled:
+        relationships["preview"] = sampled
+        relationships["needs_confirmation"] = {name: needs_confirmation(profiles[name]) for name in sampled}
+
     return relationships
 
 
+
+
+def inclusion_relationships(tables, profiles, pk_candidates, min_containment):
+    """Relationship structure built from value-based inclusion dependencies"""
+    discovered = discover_inclusion_dependencies(tables, profiles, min_containment)
+    fk_candidates = {name: [] for name in tables}
+    relations = []
+
+    for dep in discovered["inclusion_dependencies"]:
+        # A column contained in another column of its own table is not a relationship
+        if dep["from_table"] == dep["to_table"]:
+            continue
+        if dep["foreign_key"] not in fk_candidates[dep["from_table"]]:
+            fk_candidates[dep["from_table"]].append(dep["foreign_key"])
+        relations.append(dep)
+
+    return {
+        "primary_keys": pk_candidates,
+        "foreign_keys": fk_candidates,
+        "relations": relations,
+        "candidate_pairs": discovered["candidate_pairs"],
+    }
+
+
+def profile_relationships_csv(contents, approx_error=None, progress=None):
+    """
+    extract_pk_fk_relationships of raw CSV uploads ({name: bytes}), reporting progress
+    per profiled table; the /jobs/profile-data/ job body, run in a pool worker
+    """
+    tables = {}
+    profiles = {}
+    for name, content in contents.items():
+        with stage("parse_csv", bytes_read=len(content)) as current:
+            tables[name] = pd.read_csv(io.BytesIO(content))
+            current.rows = len(tables[name])
+        profiles[name] = profile_table(tables[name], approx_error=approx_error)
+        progress(len(profiles), len(contents), {"table": name, "row_count": profiles[name]["row_count"]})
+    return extract_pk_fk_relationships(tables, profiles=profiles)
@@ -0,0 +1,243 @@
+# models/profile.py
+import io
+import numpy as np
+import pandas as pd
+from utils.metrics import stage
+from utils.parallel import attach_frame, map_ordered, share_frame, split_ranges, worker_count
+from utils.hyperloglog import hll_estimate, hll_merge, hll_registers, precision_for_error, standard_error
+
+# Sketch estimates within this many relative errors of the row count are key candidates
+KEY_CANDIDATE_TOLERANCE = 3
+
+
+def _approx_column(series, non_null, row_count, approx_error):
+    """Profile a column with a HyperLogLog sketch instead of an exact hash set of its values"""
+    null_count = row_count - len(non_null)
+    sketch = hll_registers(non_null, precision_for_error(approx_error))
+    distinct = min(int(round(hll_estimate(sketch))), len(non_null))
+
+    minimum = maximum = None
+    if len(non_null):
+        try:
+            minimum, maximum = non_null.min(), non_null.max()
+        except TypeError:
+            pass
+
+    # Only a candidate: profile_table confirms it exactly
+    is_unique = null_count == 0 and distinct >= row_count * (1 - KEY_CANDIDATE_TOLERANCE * approx_error)
+    if is_unique:
+        distinct = row_count
+
+    return {
+        "dtype": str(series.dtype),
+        "null_count": int(null_count),
+        "distinct_count": distinct,
+        "min": minimum,
+        "max": maximum,
+        "is_unique": is_unique,
+        "approximate": True,
+        "sketch": sketch,
+    }
+
+
+def profile_column(series, row_count=None, approx_error=None):
+    """Compute null count, distinct count, min/max, dtype and uniqueness for one column"""
+    row_count = len(series) if row_count is None else row_count
+    non_null = series.dropna()
+    if approx_error:
+        return _approx_column(series, non_null, row_count, approx_error)
+
+    values = pd.unique(non_null)
+    if isinstance(values, pd.Categorical):
+        # Dictionary-encoded columns (see utils/columnar.py) are profiled by their values
+        values = np.asarray(values)
+    null_count = row_count - len(non_null)
+
+    minimum = maximum = None
+    if len(values):
+        try:
+            uniques = pd.Series(values)
+            minimum, maximum = uniques.min(), uniques.max()
+        except TypeError:
+            # Mixed types (e.g. numbers and strings in one object column) have no ordering
+            pass
+
+    return {
+        "dtype": str(series.dtype),
+        "null_count": int(null_count),
+        "distinct_count": len(values),
+        "min": minimum,
+        "max": maximum,
+        "is_unique": len(values) == row_count and null_count == 0,
+        "values": values,
+    }
+
+
+def confirm_unique(df, profile):
+    """Check approximate key candidates exactly; only the surviving columns pay for a hash set"""
+    row_count = profile["row_count"]
+    for col, stats in profile["columns"].items():
+        if not (stats.get("approximate") and stats["is_unique"]):
+            continue
+        if df[col].is_unique:
+            stats["approximate"] = False
+        else:
+            stats["is_unique"] = False
+            stats["distinct_count"] = min(stats["distinct_count"], row_count - 1)
+    return profile
+
+
+def _strip_column(stats):
+    stats.pop("values", None)
+    stats.pop("sketch", None)
+    return stats
+
+
+def _profile_columns_worker(handle, columns, row_count, approx_error):
+    with attach_frame(handle, columns=columns) as attached:
+        return {col: _strip_column(profile_column(attached.df[col], row_count, approx_error)) for col in columns}
+
+
+def _hash_rows_worker(handle, start, stop):
+    with attach_frame(handle, rows=(start, stop)) as attached:
+        attached.row_values[start:stop] = pd.util.hash_pandas_object(attached.df, index=False).to_numpy()
+
+
+def _profile_parallel(df, approx_error, workers):
+    """
+    Column profiles and row hashes computed by workers from a shared copy of df: column
+    chunks for the former, row ranges for the latter. Returns (row hashes, column profiles)
+    equal to the serial computation, or None when df cannot be shared.
+    """
+    with share_frame(df) as shared:
+        if shared is None:
+            return None
+        columns = list(df.columns)
+        tasks = [
+            (_profile_columns_worker, shared.handle, columns[start:stop], len(df), approx_error)
+            for start, stop in split_ranges(len(columns), workers)
+        ] + [
+            (_hash_rows_worker, shared.handle, start, stop)
+            for start, stop in split_ranges(len(df), workers)
+        ]
+        profiles = {}
+        for result in map_ordered(tasks):
+            if result is not None:
+                profiles.update(result)
+        return pd.Series(shared.row_values()), {col: profiles[col] for col in columns}
+
+
+def profile_table(df, mergeable=False, approx_error=None, workers=None):
+    """
+    Profile every column of a DataFrame in a single pass.
+    With mergeable=True the distinct values (or sketches) and row hashes are kept
+    so that profiles of separate chunks can be combined with merge_profiles.
+    With approx_error set, distinct counts come from HyperLogLog sketches with that
+    relative standard error and only key candidates are counted exactly.
+    Large frames are profiled on up to `workers` processes (default ANALYSIS_WORKERS)
+    with the same result as the serial path.
+    """
+    row_count = len(df)
+    with stage("profile", rows=row_count):
+        parallel = None
+        if not mergeable and len(df.columns) and worker_count(df.size, workers) > 1:
+            parallel = _profile_parallel(df, approx_error, worker_count(df.size, workers))
+        if parallel is not None:
+            row_hashes, columns = parallel
+        else:
+            row_hashes = pd.util.hash_pandas_object(df, index=False) if len(df.columns) else pd.Series([], dtype="uint64")
+            columns = {col: profile_column(df[col], row_count, approx_error) for col in df.columns}
+        duplicated = row_hashes.duplicated()
+
+        profile = {
+            "row_count": row_count,
+            "duplicate_rows": int(duplicated.sum()),
+            "columns": columns,
+        }
+        if approx_error:
+            confirm_unique(df, profile)
+
+    if mergeable:
+        profile["row_hashes"] = row_hashes[~duplicated].to_numpy()
+    else:
+        for column in profile["columns"].values():
+            _strip_column(column)
+    return profile
+
+
+def _merge_columns(a, b, row_count):
+    null_count = a["null_count"] + b["null_count"]
+    if "sketch" in a and "sketch" in b:
+        sketch = hll_merge(a["sketch"], b["sketch"])
+        distinct = min(int(round(hll_estimate(sketch))), row_count - null_count)
+        error = standard_error(int(np.log2(len(sketch))))
+        # The rows are gone, so a merged sketch can only name an unconfirmed candidate
+        is_unique = null_count == 0 and distinct >= row_count * (1 - KEY_CANDIDATE_TOLERANCE * error)
+        if is_unique:
+            distinct = row_count
+        extra = {"approximate": True, "sketch": sketch}
+    elif "values" in a and "values" in b:
+        values = pd.unique(np.concatenate([np.asarray(a["values"], dtype=object), np.asarray(b["values"], dtype=object)]))
+        distinct = len(values)
+        is_unique = distinct == row_count and null_count == 0
+        extra = {"values": values}
+    else:
+        raise ValueError("Cannot merge an exact column profile with an approximate one")
+
+    bounds = [v for v in (a["min"], b["min"], a["max"], b["max"]) if v is not None]
+    minimum = maximum = None
+    if bounds:
+        try:
+            minimum, maximum = min(bounds), max(bounds)
+        except TypeError:
+            pass
+
+    return {
+        "dtype": a["dtype"] if a["dtype"] == b["dtype"] else "object",
+        "null_count": null_count,
+        "distinct_count": distinct,
+        "min": minimum,
+        "max": maximum,
+        "is_unique": is_unique,
+        **extra,
+    }
+
+
+def merge_profiles(a, b):
+    """Combine two mergeable profiles (e.g. of consecutive CSV chunks) into one"""
+    if "row_hashes" not in a or "row_hashes" not in b:
+        raise ValueError("Only profiles built with mergeable=True can be merged")
+
+    row_count = a["row_count"] + b["row_count"]
+    # Rows of b whose hash already appeared in a are duplicates across the chunk boundary
+    cross_duplicates = int(np.isin(b["row_hashes"], a["row_hashes"]).sum())
+
+    columns = {}
+    for col in list(a["columns"]) + [c for c in b["columns"] if c not in a["columns"]]:
+        if col in a["columns"] and col in b["columns"]:
+            columns[col] = _merge_columns(a["columns"][col], b["columns"][col], row_count)
+        else:
+            # A column missing from one side is entirely null there
+            present, missing_rows = (a["columns"][col], b["row_count"]) if col in a["columns"] else (b["columns"][col], a["row_count"])
+            null_count = present["null_count"] + missing_rows
+            columns[col] = dict(present, null_count=null_count, is_unique=present["distinct_count"] == row_count and null_count == 0)
+
+    return {
+        "row_count": row_count,
+        "duplicate_rows": a["duplicate_rows"] + b["duplicate_rows"] + cross_duplicates,
+        "columns": columns,
+        "row_hashes": np.union1d(a["row_hashes"], b["row_hashes"]),
+    }
+
+
+def profile_tables(tables, approx_error=None, workers=None):
+    """Profile a dict of {name: DataFrame} once so several analyzers can share the result"""
+    return {name: profile_table(df, approx_error=approx_error, workers=workers) for name, df in tables.items()}
+
+
+def profile_csv(content, approx_error=None):
+    """Parse raw CSV bytes and profile them; small enough to return from a worker process"""
+    with stage("parse_csv", bytes_read=len(content)) as current:
+        df = pd.read_csv(io.BytesIO(content))
+        current.rows = len(df)
+    return profile_table(df, approx_error=approx_error)
@@ -0,0 +1,135 @@
+# models/stats_catalog.py
+import sqlite3
+import numpy as np
+import pandas as pd
+from utils.helpers import quote_identifier
+from utils.hyperloglog import hll_estimate, hll_merge, hll_registers, standard_error
+from models.profile import KEY_CANDIDATE_TOLERANCE
+from models.duplicates import FINGERPRINTS_TABLE, ensure_fingerprints, record_fingerprints, row_fingerprints, value_hashes
+
+CATALOG_PRECISION = 14  # 16384 registers, ~0.8% standard error on distinct counts
+REBUILD_CHUNK_SIZE = 50_000
+
+TABLES_TABLE = "_profile_tables"
+STATS_TABLE = "_profile_stats"
+
+
+def ensure_catalog(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {TABLES_TABLE} "
+        "(table_name TEXT PRIMARY KEY, row_count INTEGER NOT NULL, duplicate_rows INTEGER NOT NULL)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {STATS_TABLE} "
+        "(table_name TEXT, column_name TEXT, position INTEGER, null_count INTEGER NOT NULL, sketch BLOB NOT NULL, "
+        "PRIMARY KEY (table_name, column_name))"
+    )
+    ensure_fingerprints(conn)
+
+
+def reset_table_stats(conn, table_name):
+    """Forget the statistics of a table that is about to be replaced"""
+    ensure_catalog(conn)
+    for catalog_table in (TABLES_TABLE, STATS_TABLE, FINGERPRINTS_TABLE):
+        conn.execute(f"DELETE FROM {catalog_table} WHERE table_name = ?", (table_name,))
+
+
+def load_table_stats(conn, table_name, columns):
+    """Current catalog entry of a table as an in-memory accumulator (empty if none yet)"""
+    ensure_catalog(conn)
+    row = conn.execute(f"SELECT row_count, duplicate_rows FROM {TABLES_TABLE} WHERE table_name = ?", (table_name,)).fetchone()
+    stored = {
+        name: (null_count, np.frombuffer(sketch, dtype=np.uint8).copy())
+        for name, null_count, sketch in conn.execute(
+            f"SELECT column_name, null_count, sketch FROM {STATS_TABLE} WHERE table_name = ?", (table_name,)
+        )
+    }
+    empty = (0, np.zeros(1 << CATALOG_PRECISION, dtype=np.uint8))
+    return {
+        "row_count": row[0] if row else 0,
+        "duplicate_rows": row[1] if row else 0,
+        "columns": {col: dict(zip(("null_count", "sketch"), stored.get(col, empty))) for col in columns},
+    }
+
+
+def accumulate_chunk(conn, table_name, stats, chunk):
+    """Fold a chunk of newly ingested rows into the accumulator and the table's fingerprint index"""
+    for col in chunk.columns:
+        non_null = chunk[col].dropna()
+        column = stats["columns"][col]
+        column["null_count"] += len(chunk) - len(non_null)
+        # Hashed like fingerprints, so a value sketches the same whether a chunk parsed it as int or float
+        column["sketch"] = hll_merge(column["sketch"], hll_registers(value_hashes(non_null), CATALOG_PRECISION))
+
+    # Rows whose fingerprint is already stored (from earlier chunks or uploads) are duplicates
+    stats["duplicate_rows"] += record_fingerprints(conn, table_name, row_fingerprints(chunk), stats["row_count"])
+    stats["row_count"] += len(chunk)
+
+
+def save_table_stats(conn, table_name, stats):
+    conn.execute(
+        f"INSERT OR REPLACE INTO {TABLES_TABLE} (table_name, row_count, duplicate_rows) VALUES (?, ?, ?)",
+        (table_name, stats["row_count"], stats["duplicate_rows"]),
+    )
+    conn.executemany(
+        f"INSERT OR REPLACE INTO {STATS_TABLE} (table_name, column_name, position, null_count, sketch) VALUES (?, ?, ?, ?, ?)",
+        (
+            (table_name, col, position, column["null_count"], column["sketch"].tobytes())
+            for position, (col, column) in enumerate(stats["columns"].items())
+        ),
+    )
+
+
+def rebuild_table_stats(conn, table_name, data=None, chunk_size=REBUILD_CHUNK_SIZE):
+    """
+    Full rescan of a table into the catalog; only needed for tables loaded some other way.
+    Pass the table as `data` when it is already loaded, so it is not read again.
+    """
+    reset_table_stats(conn, table_name)
+    if data is None:
+        chunks = pd.read_sql_query(f"SELECT * FROM {quote_identifier(table_name)}", conn, chunksize=chunk_size)
+    else:
+        chunks = (data.iloc[start:start + chunk_size] for start in range(0, len(data), chunk_size))
+    stats = None
+    for chunk in chunks:
+        if stats is None:
+            stats = load_table_stats(conn, table_name, list(chunk.columns))
+        accumulate_chunk(conn, table_name, stats, chunk)
+    if stats is not None:
+        save_table_stats(conn, table_name, stats)
+
+
+def catalog_profile(conn, table_name):
+    """
+    Table profile answered from the catalog in constant time, in the shape of
+    models.profile.profile_table; None when the table has no catalog entry.
+    """
+    try:
+        row = conn.execute(f"SELECT row_count, duplicate_rows FROM {TABLES_TABLE} WHERE table_name = ?", (table_name,)).fetchone()
+    except sqlite3.OperationalError:
+        # Catalog not created yet
+        return None
+    if row is None:
+        return None
+
+    row_count, duplicate_rows = row
+    columns = {}
+    for col, null_count, sketch in conn.execute(
+        f"SELECT column_name, null_count, sketch FROM {STATS_TABLE} WHERE table_name = ? ORDER BY position", (table_name,)
+    ):
+        registers = np.frombuffer(sketch, dtype=np.uint8)
+        columns[col] = {
+            "null_count": null_count,
+            "distinct_count": min(int(round(hll_estimate(registers))), row_count - null_count),
+            "approximate": True,
+        }
+    return {"row_count": row_count, "duplicate_rows": duplicate_rows, "columns": columns}
+
+
+def key_candidates(stats):
+    """Columns the catalog cannot rule out as a primary key (NOT NULL and ~all values distinct)"""
+    tolerance = KEY_CANDIDATE_TOLERANCE * standard_error(CATALOG_PRECISION)
+    return [
+        col for col, column in stats["columns"].items()
+        if column["null_count"] == 0 and hll_estimate(column["sketch"]) >= stats["row_count"] * (1 - tolerance)
+    ]
@@ -0,0 +1,316 @@
+# models/streaming_correlation.py
+import os
+import tempfile
+from itertools import zip_longest
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from fastapi import HTTPException
+from models.correlation import (
+    XGB_PARAMS, XGB_NUM_BOOST_ROUND, XGB_EARLY_STOPPING_ROUNDS, clean_file1_result, correlation_result, importance_result,
+)
+from utils.db import read_connection
+from utils.helpers import quote_identifier
+from utils.metrics import stage
+
+CHUNK_SIZE = 50_000  # rows read from a source at a time
+SCHEMA_SAMPLE_ROWS = 10_000  # CSV rows used to decide which columns are text
+TEST_FRACTION = 0.2
+SPLIT_HASH = 2654435761  # Knuth's multiplicative hash of the row number picks the test rows
+STREAM_WORK_DIR = os.environ.get("STREAM_WORK_DIR")  # spill files of the XGBoost path (default: system temp dir)
+
+
+class ChunkSource:
+    """
+    A table read in fixed-size chunks: a SQLite table name, or a path ending in .csv
+    (for internal and benchmark callers only; endpoints accept stored tables alone).
+    Text columns are label-encoded with a vocabulary gathered in a first pass over
+    just those columns; the codes equal LabelEncoder's on the full column, missing
+    values included as the label 'nan'.
+    """
+
+    def __init__(self, source, chunk_size=CHUNK_SIZE):
+        self.source = source
+        self.chunk_size = chunk_size
+        self.is_csv = source.lower().endswith(".csv")
+        if self.is_csv:
+            sample = pd.read_csv(source, nrows=SCHEMA_SAMPLE_ROWS)
+            self.columns = list(sample.columns)
+            text = [col for col in self.columns if not pd.api.types.is_numeric_dtype(sample[col])]
+        else:
+            with read_connection() as conn:
+                info = conn.execute(f"PRAGMA table_info({quote_identifier(source)})").fetchall()
+            if not info:
+                raise HTTPException(status_code=404, detail=f"Table not found: {source}")
+            self.columns = [row[1] for row in info]
+            text = [row[1] for row in info if row[2].upper() not in ("INTEGER", "REAL")]
+        self.vocabularies = self._vocabularies(text) if text else {}
+
+    def chunks(self, columns=None):
+        """Raw DataFrame chunks in file or rowid order"""
+        if self.is_csv:
+            yield from pd.read_csv(self.source, chunksize=self.chunk_size, usecols=columns)
+            return
+        selected = ", ".join(quote_identifier(col) for col in columns) if columns else "*"
+        with read_connection() as conn:
+            yield from pd.read_sql_query(
+                f"SELECT {selected} FROM {quote_identifier(self.source)} ORDER BY rowid", conn, chunksize=self.chunk_size
+            )
+
+    def _vocabularies(self, text_columns):
+        seen = {col: set() for col in text_columns}
+        for chunk in self.chunks(text_columns):
+            for col in text_columns:
+                seen[col].update(text_labels(chunk[col]).unique())
+        return {col: pd.Index(sorted(values)) for col, values in seen.items()}
+
+    def encoded_chunks(self, dtype=np.float64):
+        """Chunks as float matrices over self.columns; missing numeric values are NaN"""
+        for chunk in self.chunks():
+            with stage("stream_chunk", rows=len(chunk)):
+                out = np.empty((len(chunk), len(self.columns)), dtype=dtype)
+                for i, col in enumerate(self.columns):
+                    if col in self.vocabularies:
+                        out[:, i] = self.vocabularies[col].get_indexer(text_labels(chunk[col]))
+                    else:
+                        out[:, i] = pd.to_numeric(chunk[col], errors="coerce").to_numpy(dtype=np.float64, na_value=np.nan)
+            yield out
+
+
+def text_labels(series):
+    """String labels of a text column as utils.frames.encode_column sees them (missing -> 'nan')"""
+    return series.fillna("nan").astype(str)
+
+
+class CorrelationMoments:
+    """
+    Mergeable sufficient statistics for Pearson correlation with pairwise deletion.
+    For every column pair (i, j) it keeps the number of rows where both are present,
+    the mean of column i over those rows, its sum of squared deviations and the
+    co-moment with column j. Chunks are combined with Chan et al.'s parallel update,
+    which stays accurate where raw sums of squares would cancel.
+    """
+
+    def __init__(self, k):
+        self.n = np.zeros((k, k))
+        self.mean = np.zeros((k, k))
+        self.m2 = np.zeros((k, k))
+        self.comoment = np.zeros((k, k))
+
+    @classmethod
+    def from_chunk(cls, X):
+        moments = cls(X.shape[1])
+        present = ~np.isnan(X)
+        mask = present.astype(np.float64)
+        counts = present.sum(axis=0)
+        # Centering by the chunk's column means keeps the products below well conditioned
+        with np.errstate(invalid="ignore", divide="ignore"):
+            shift = np.where(counts > 0, np.where(present, X, 0.0).sum(axis=0) / counts, 0.0)
+        centered = np.where(present, X - shift, 0.0)
+
+        n = mask.T @ mask
+        sums = centered.T @ mask  # sum of column i over the rows where i and j are both present
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(n > 0, sums / n, 0.0)
+        moments.n = n
+        moments.mean = mean + shift[:, None]
+        moments.m2 = (centered * centered).T @ mask - sums * mean
+        moments.comoment = centered.T @ centered - sums * mean.T
+        return moments
+
+    def merge(self, other):
+        n = self.n + other.n
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(n > 0, other.n / n, 0.0)
+        delta = other.mean - self.mean
+        scale = self.n * weight  # n_a * n_b / n
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + other.m2 + delta * delta * scale
+        self.comoment = self.comoment + other.comoment + delta * delta.T * scale
+        self.n = n
+        return self
+
+    def correlation(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = self.comoment / np.sqrt(self.m2 * self.m2.T)
+        corr[self.n < 2] = np.nan
+        return np.clip(corr, -1.0, 1.0)
+
+
+def aligned_chunks(source1, source2):
+    """
+    Row-aligned chunks of both sources side by side. Once the shorter source runs out
+    its columns are NaN, like the index alignment of pd.concat in combined_correlation.
+    """
+    k1, k2 = len(source1.columns), len(source2.columns)
+    for chunk1, chunk2 in zip_longest(source1.encoded_chunks(), source2.encoded_chunks()):
+        rows1 = 0 if chunk1 is None else len(chunk1)
+        rows2 = 0 if chunk2 is None else len(chunk2)
+        X = np.full((max(rows1, rows2), k1 + k2), np.nan)
+        if rows1:
+            X[:rows1, :k1] = chunk1
+        if rows2:
+            X[:rows2, k1:] = chunk2
+        yield X
+
+
+def streaming_combined_correlation(source1, source2, method="pearson", chunk_size=CHUNK_SIZE):
+    """
+    combined_correlation over two sources (SQLite table names or .csv paths) in one pass,
+    keeping only O(columns^2) statistics in memory. Missing numeric values are left out
+    pairwise instead of being filled with the column median, which needs the whole column.
+    """
+    if method != "pearson":
+        raise HTTPException(status_code=400, detail="Streaming correlation supports only method=pearson")
+
+    source1 = ChunkSource(source1, chunk_size)
+    source2 = ChunkSource(source2, chunk_size)
+    moments = CorrelationMoments(len(source1.columns) + len(source2.columns))
+    for X in aligned_chunks(source1, source2):
+        moments.merge(CorrelationMoments.from_chunk(X))
+
+    return correlation_result(moments.correlation(), source1.columns, source2.columns)
+
+
+def spill(source, path):
+    """Write a source's encoded float32 rows to a raw file and memory-map it back"""
+    rows = 0
+    with open(path, "wb") as f:
+        for chunk in source.encoded_chunks(np.float32):
+            f.write(chunk.tobytes())
+            rows += len(chunk)
+    if rows == 0:
+        return np.empty((0, len(source.columns)), dtype=np.float32)
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(rows, len(source.columns)))
+
+
+def test_rows(start, stop):
+    """Deterministic ~TEST_FRACTION share of row numbers in [start, stop)"""
+    hashed = (np.arange(start, stop, dtype=np.uint64) * np.uint64(SPLIT_HASH)) & np.uint64(0xFFFFFFFF)
+    return hashed < np.uint64(TEST_FRACTION * 2 ** 32)
+
+
+class SpilledIterator(xgb.DataIter):
+    """Feeds XGBoost one chunk of the spilled matrices at a time: the train or the test rows"""
+
+    def __init__(self, batches, test, cache_prefix):
+        self._batches = batches
+        self._test = test
+        self._iterator = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._iterator is None:
+            self._iterator = self._batches()
+        for start, X, y in self._iterator:
+            keep = ~np.isnan(y) & (test_rows(start, start + len(y)) == self._test)
+            if keep.any():
+                input_data(data=X[keep], label=y[keep])
+                return True
+        return False
+
+    def reset(self):
+        self._iterator = None
+
+
+def column_chunk(blocks, column, start, stop):
+    """Rows [start, stop) of one column of the horizontally joined blocks"""
+    for block in blocks:
+        if column < block.shape[1]:
+            return np.asarray(block[start:stop, column], dtype=np.float32)
+        column -= block.shape[1]
+    raise IndexError(column)
+
+
+def train_streaming_target(blocks, target, features, rows, chunk_size, cache_prefix):
+    """
+    Train one model on the column `target` of the horizontally joined memory-mapped blocks,
+    reading chunk_size rows at a time. Returns importance_result(), or None for a constant
+    or empty target.
+    """
+    def batches():
+        for start in range(0, rows, chunk_size):
+            chunk = np.hstack([block[start:min(start + chunk_size, rows)] for block in blocks])
+            yield start, np.delete(chunk, target, axis=1), chunk[:, target]
+
+    low, high, has_test = np.inf, -np.inf, False
+    for start in range(0, rows, chunk_size):
+        y = column_chunk(blocks, target, start, min(start + chunk_size, rows))
+        labelled = ~np.isnan(y)
+        if labelled.any():
+            low, high = min(low, y[labelled].min()), max(high, y[labelled].max())
+            has_test = has_test or bool((labelled & test_rows(start, start + len(y))).any())
+    if not low < high:
+        return None
+
+    dtrain = xgb.ExtMemQuantileDMatrix(SpilledIterator(batches, False, f"{cache_prefix}-train"), missing=np.nan)
+    dtrain.feature_names = features
+    evals = [(dtrain, 'train')]
+    if has_test:
+        dtest = xgb.ExtMemQuantileDMatrix(SpilledIterator(batches, True, f"{cache_prefix}-test"), missing=np.nan, ref=dtrain)
+        dtest.feature_names = features
+        evals.append((dtest, 'test'))
+
+    model = xgb.train(
+        dict(XGB_PARAMS, nthread=os.cpu_count() or 1),
+        dtrain,
+        num_boost_round=XGB_NUM_BOOST_ROUND,
+        evals=evals,
+        early_stopping_rounds=XGB_EARLY_STOPPING_ROUNDS if has_test else None,
+        verbose_eval=False
+    )
+
+    mse = None
+    if has_test:
+        # MSE over the test rows, predicted chunk by chunk
+        squared_error = count = 0.0
+        iteration_range = (0, model.best_iteration + 1)
+        for start, X, y in batches():
+            keep = ~np.isnan(y) & test_rows(start, start + len(y))
+            if keep.any():
+                predicted = model.inplace_predict(X[keep], iteration_range=iteration_range, missing=np.nan)
+                squared_error += float(((y[keep] - predicted) ** 2).sum())
+                count += int(keep.sum())
+        mse = squared_error / count
+    return importance_result(model, features, mse)
+
+
+def streaming_ml_combined_correlation(source1, source2, chunk_size=CHUNK_SIZE, progress=None):
+    """
+    ml_combined_correlation over two sources (SQLite table names or .csv paths) without
+    loading them: both are encoded once into float32 spill files, and every model trains
+    from XGBoost's external-memory iterator over them. Rows are joined by position and
+    the test split is a fixed hash of the row number. Missing values are passed to
+    XGBoost as missing instead of being filled with the median; rows with a missing
+    target are left out of that target's model.
+    """
+    source1 = ChunkSource(source1, chunk_size)
+    source2 = ChunkSource(source2, chunk_size)
+    correlation_results = {"file1_correlations": {}, "file2_correlations": {}}
+    total = len(source1.columns) + len(source2.columns)
+
+    with tempfile.TemporaryDirectory(prefix="rbasic-stream-", dir=STREAM_WORK_DIR) as work_dir:
+        data1 = spill(source1, os.path.join(work_dir, "data1.f32"))
+        data2 = spill(source2, os.path.join(work_dir, "data2.f32"))
+        combined_columns = [f"file1_{col}" for col in source1.columns] + [f"file2_{col}" for col in source2.columns]
+        targets = [
+            ("file1_correlations", col, [data1, data2], i, combined_columns, min(len(data1), len(data2)))
+            for i, col in enumerate(source1.columns)
+        ] + [
+            ("file2_correlations", col, [data2], i, list(source2.columns), len(data2))
+            for i, col in enumerate(source2.columns)
+        ]
+
+        for done, (section, col, blocks, target, columns, rows) in enumerate(targets, start=1):
+            features = columns[:target] + columns[target + 1:]
+            with stage("xgb_train", rows=rows):
+                result = train_streaming_target(blocks, target, features, rows, chunk_size, os.path.join(work_dir, f"target{done}"))
+            if result and section == "file1_correlations":
+                result = clean_file1_result(result)
+            if result:
+                correlation_results[section][col] = result
+            if progress:
+                progress(done, total, {"section": section, "column": col, "result": result})
+        del data1, data2  # release the memory maps before the spill files are removed
+
+    return correlation_results
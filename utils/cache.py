@@ -0,0 +1,136 @@
+# utils/cache.py
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+VERSIONS_TABLE = "_data_versions"
+DEFAULT_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+
+
+class ResultCache:
+    """
+    LRU cache for analysis results, bounded by the pickled size of the entries.
+    With disk_dir set, entries are also written there and survive memory eviction
+    and restarts. Entries can carry tags (table names) for targeted invalidation.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()  # key -> (payload, tags)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.pkl")
+
+    def _store(self, key, payload, tags):
+        if key in self._entries:
+            self._bytes -= len(self._entries.pop(key)[0])
+        if len(payload) > self.max_bytes:
+            return
+        self._entries[key] = (payload, tags)
+        self._bytes += len(payload)
+        while self._bytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self._bytes -= len(evicted)
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return pickle.loads(self._entries[key][0])
+
+            if self.disk_dir and os.path.exists(self._disk_path(key)):
+                with open(self._disk_path(key), "rb") as f:
+                    payload = f.read()
+                self._store(key, payload, ())
+                self.disk_hits += 1
+                return pickle.loads(payload)
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value, tags=()):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store(key, payload, tuple(tags))
+        if self.disk_dir:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+
+    def invalidate(self, tag):
+        """Drop every in-memory entry tagged with tag (e.g. a table that was just replaced)"""
+        with self._lock:
+            for key in [key for key, (_, tags) in self._entries.items() if tag in tags]:
+                self._bytes -= len(self._entries.pop(key)[0])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+result_cache = ResultCache(disk_dir=os.environ.get("RESULT_CACHE_DIR"))
+
+
+def cache_key(namespace, *parts):
+    """Stable key from raw bytes (e.g. uploaded file contents) and plain values"""
+    digest = hashlib.blake2b(namespace.encode(), digest_size=20)
+    for part in parts:
+        if not isinstance(part, (bytes, bytearray)):
+            part = repr(part).encode()
+        digest.update(len(part).to_bytes(8, "little"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def ensure_versions_table(conn):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {VERSIONS_TABLE} (table_name TEXT PRIMARY KEY, version INTEGER NOT NULL)")
+
+
+def table_versions(conn, table_names):
+    """Data-version stamp per table; tables never uploaded through /upload-csv/ are version 0"""
+    try:
+        rows = dict(conn.execute(f"SELECT table_name, version FROM {VERSIONS_TABLE}").fetchall())
+    except sqlite3.OperationalError:
+        # No upload has recorded a version yet
+        rows = {}
+    return {name: rows.get(name, 0) for name in table_names}
+
+
+def bump_table_version(conn, table_name):
+    """Record that table_name changed and drop cached results computed from it"""
+    ensure_versions_table(conn)
+    conn.execute(
+        f"INSERT INTO {VERSIONS_TABLE} (table_name, version) VALUES (?, 1) "
+        "ON CONFLICT(table_name) DO UPDATE SET version = version + 1",
+        (table_name,),
+    )
+    conn.commit()
+    result_cache.invalidate(table_name)
@@ -0,0 +1,138 @@
+# utils/columnar.py
+import os
+import urllib.parse
+import numpy as np
+import pandas as pd
+from utils.helpers import quote_identifier
+from utils.frames import low_cardinality
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: without pyarrow every read falls back to SQLite
+    pa = None
+
+COLUMNAR_DIR = os.environ.get("COLUMNAR_DIR", "columnar")
+VERSION_KEY = b"data_version"
+WRITE_CHUNK_ROWS = 50_000  # rows read from SQLite per record batch
+
+
+def columnar_path(table_name, directory=COLUMNAR_DIR):
+    return os.path.join(directory, urllib.parse.quote(table_name, safe="") + ".arrow")
+
+
+def column_types(conn, table_name, distinct_counts=None):
+    """
+    Arrow schema of a table from what SQLite actually stores, found in one aggregate
+    scan: text and numbers mixed in one column (type affinity allows it) become strings,
+    and text columns that distinct_counts ({column: count}, e.g. the statistics catalog)
+    shows to be low-cardinality become dictionaries.
+    """
+    distinct_counts = distinct_counts or {}
+    table = quote_identifier(table_name)
+    columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    probes = ", ".join(
+        f"SUM(typeof({col}) IN ('text', 'blob')), SUM(typeof({col}) = 'real'), SUM(typeof({col}) = 'integer')"
+        for col in (quote_identifier(col) for col in columns)
+    )
+    counts = conn.execute(f"SELECT COUNT(*), {probes} FROM {table}").fetchone()
+    rows = counts[0]
+
+    fields = []
+    for i, col in enumerate(columns):
+        text, real, integer = (value or 0 for value in counts[1 + 3 * i: 4 + 3 * i])
+        if text and not (real or integer) and col in distinct_counts and low_cardinality(distinct_counts[col], rows):
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif text:
+            arrow_type = pa.string()
+        elif real:
+            arrow_type = pa.float64()
+        elif integer:
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.null()
+        fields.append(pa.field(col, arrow_type))
+    return pa.schema(fields)
+
+
+def dictionary_batch_column(series, dictionary):
+    """
+    Dictionary-encode one batch of a column against the values seen in earlier batches.
+    New values are appended to `dictionary` (a pd.Index), so each batch's dictionary
+    extends the previous one and the IPC file stores it as a delta.
+    """
+    encoded = pa.array(series, type=pa.string(), from_pandas=True).dictionary_encode()
+    values = encoded.dictionary.to_pandas()
+    dictionary = dictionary.append(pd.Index(values[~values.isin(dictionary)]))
+    remap = dictionary.get_indexer(values)
+    indices = encoded.indices.to_numpy(zero_copy_only=False)
+    missing = encoded.indices.is_null().to_numpy(zero_copy_only=False)
+    codes = remap[np.where(missing, 0, indices).astype(np.int64)] if len(values) else np.zeros(len(indices), dtype=np.int64)
+    array = pa.DictionaryArray.from_arrays(pa.array(codes, type=pa.int32(), mask=missing), pa.array(dictionary, type=pa.string()))
+    return array, dictionary
+
+
+def record_batch(chunk, schema, dictionaries):
+    """A chunk of SQLite rows as a record batch of the fixed schema; updates the running dictionaries"""
+    arrays = []
+    for field in schema:
+        series = chunk[field.name]
+        if pa.types.is_dictionary(field.type):
+            array, dictionaries[field.name] = dictionary_batch_column(series, dictionaries.get(field.name, pd.Index([], dtype=object)))
+            arrays.append(array)
+        elif pa.types.is_string(field.type):
+            arrays.append(pa.array(series.astype(str).where(series.notna(), None), type=pa.string(), from_pandas=True))
+        else:
+            arrays.append(pa.array(series, type=field.type, from_pandas=True))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_columnar(conn, table_name, version, distinct_counts=None, directory=COLUMNAR_DIR, chunk_size=WRITE_CHUNK_ROWS):
+    """
+    Write a typed Arrow IPC copy of a SQLite table, stamped with its data version.
+    Rows are streamed in chunks as record batches of a schema fixed up front, so memory
+    stays bounded by the chunk size. Low-cardinality text columns (by distinct_counts)
+    are stored dictionary-encoded, categoricals in pandas. The file is replaced
+    atomically so readers never see a half-written copy.
+    """
+    if pa is None:
+        return None
+    schema = column_types(conn, table_name, distinct_counts).with_metadata({VERSION_KEY: str(version).encode()})
+
+    os.makedirs(directory, exist_ok=True)
+    path = columnar_path(table_name, directory)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    dictionaries = {}
+    try:
+        options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+            for chunk in pd.read_sql_query(f"SELECT * FROM {quote_identifier(table_name)} ORDER BY rowid", conn, chunksize=chunk_size):
+                writer.write_batch(record_batch(chunk, schema, dictionaries))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return path
+
+
+def read_columnar(table_name, version, columns=None, directory=COLUMNAR_DIR):
+    """
+    Memory-map the Arrow copy of a table and return the requested columns as a DataFrame.
+    Returns None when pyarrow is missing or the copy is absent or stale, so callers fall
+    back to SQLite.
+    """
+    if pa is None:
+        return None
+    try:
+        source = pa.memory_map(columnar_path(table_name, directory), "r")
+    except FileNotFoundError:
+        return None
+    with source:
+        reader = pa.ipc.open_file(source)
+        if (reader.schema.metadata or {}).get(VERSION_KEY) != str(version).encode():
+            return None
+        table = reader.read_all()
+        if columns is not None:
+            table = table.select(list(columns))
+        return table.to_pandas()
+
@@ -0,0 +1,131 @@
+# utils/db.py
+import os
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DATABASE = "database.db"
+READ_POOL_SIZE = int(os.environ.get("SQLITE_READ_POOL_SIZE", 8))
+POOL_TIMEOUT = 30  # seconds to wait for a free connection
+MMAP_SIZE = 256 * 1024 * 1024  # bytes of the database file mapped into memory
+CACHE_SIZE = -64 * 1024  # negative = KiB, i.e. a 64 MiB page cache per connection
+STATEMENT_CACHE = 256  # prepared statements kept per connection
+
+
+def regexp(pattern, value):
+    """SQLite regexp(pattern, value): true when the whole value matches"""
+    return value is not None and re.fullmatch(pattern, str(value)) is not None
+
+
+def connect(path=DATABASE, readonly=False):
+    """Open a tuned connection that may be handed between FastAPI's worker threads"""
+    conn = sqlite3.connect(path, timeout=POOL_TIMEOUT, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+    conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size={CACHE_SIZE}")
+    conn.create_function("regexp", 2, regexp, deterministic=True)
+    if readonly:
+        conn.execute("PRAGMA query_only=ON")
+    else:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class ConnectionPool:
+    """
+    Read-only connections shared through a queue plus one writer connection.
+    In WAL mode readers never block the writer, and serialising writes in-process
+    avoids SQLITE_BUSY retries between threads.
+    """
+
+    def __init__(self, path=DATABASE, size=READ_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.RLock()
+
+    def _acquire_reader(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return connect(self.path, readonly=True)
+                except Exception:
+                    self._created -= 1
+                    raise
+        return self._idle.get(timeout=POOL_TIMEOUT)
+
+    def _release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # The connection is unusable; drop it so a fresh one can be opened
+            conn.close()
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def read(self):
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def write(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = connect(self.path)
+            try:
+                yield self._writer
+                self._writer.commit()
+            except BaseException:
+                self._writer.rollback()
+                raise
+
+    def close(self):
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._created = 0
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path=DATABASE):
+    with _pools_lock:
+        if path not in _pools:
+            _pools[path] = ConnectionPool(path)
+        return _pools[path]
+
+
+def read_connection(path=DATABASE):
+    """Context manager yielding a pooled read-only connection"""
+    return get_pool(path).read()
+
+
+def write_connection(path=DATABASE):
+    """Context manager yielding the single writer connection; commits on success"""
+    return get_pool(path).write()
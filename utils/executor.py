@@ -0,0 +1,74 @@
+# utils/executor.py
+import asyncio
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fastapi import HTTPException, UploadFile
+import pandas as pd
+from utils.metrics import record, run_collecting, stage
+
+MAX_WORKERS = int(os.environ.get("ANALYSIS_WORKERS", os.cpu_count() or 1))
+MAX_PENDING = int(os.environ.get("ANALYSIS_MAX_PENDING", MAX_WORKERS * 2))  # running + queued jobs
+QUEUE_TIMEOUT = 30  # seconds a request may wait for a free slot before getting a 503
+UPLOAD_READ_SIZE = 1024 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+_slots = asyncio.Semaphore(MAX_PENDING)
+
+
+def get_process_pool():
+    """Shared pool for CPU-bound analysis; spawned so workers never inherit the server's threads"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+async def run_cpu_bound(fn, *args):
+    """
+    Run fn(*args) in the process pool without blocking the event loop.
+    Stages recorded in the worker are added to the current request's metrics.
+    At most MAX_PENDING jobs are admitted; further requests wait up to QUEUE_TIMEOUT
+    seconds for a slot and are then turned away with 503 instead of piling up.
+    """
+    try:
+        await asyncio.wait_for(_slots.acquire(), QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Analysis workers are busy, please retry later")
+    try:
+        result, stages = await asyncio.get_running_loop().run_in_executor(get_process_pool(), run_collecting, fn, *args)
+    finally:
+        _slots.release()
+    for worker_stage in stages:
+        record(worker_stage)
+    return result
+
+
+async def read_upload(file: UploadFile):
+    """Read an upload in chunks without blocking the event loop"""
+    with stage("read_upload") as current:
+        buffer = bytearray()
+        while chunk := await file.read(UPLOAD_READ_SIZE):
+            buffer.extend(chunk)
+        current.bytes_read = len(buffer)
+    return bytes(buffer)
+
+
+async def read_uploads(files):
+    """Read all uploads concurrently into {filename: bytes}"""
+    contents = await asyncio.gather(*(read_upload(file) for file in files))
+    return {file.filename: content for file, content in zip(files, contents)}
+
+
+def analyze_csv(analyzer, contents, kwargs):
+    """Worker entry point: parse raw CSV uploads and run a table analyzer on them"""
+    tables = {}
+    for name, content in contents.items():
+        with stage("parse_csv", bytes_read=len(content)) as current:
+            tables[name] = pd.read_csv(io.BytesIO(content))
+            current.rows = len(tables[name])
+    return analyzer(tables, **kwargs)
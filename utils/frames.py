@@ -0,0 +1,96 @@
+# utils/frames.py
+import io
+import numpy as np
+import pandas as pd
+from utils.metrics import stage
+
+# Text columns become categoricals when their distinct values are at most this share of
+# the rows and at most CATEGORY_MAX_DISTINCT; above that the codes plus categories cost
+# about as much memory as the object column they replace
+CATEGORY_MAX_RATIO = 0.05
+CATEGORY_MAX_DISTINCT = 10_000
+CATEGORY_SAMPLE_ROWS = 10_000  # rows sampled to estimate distinct values when no count is known
+CATEGORY_SAMPLE_SEED = 42  # fixed so the same data always gets the same dtypes
+
+
+def downcast_numeric(series):
+    """Smallest integer type that holds the column; floats go to float32 only when that is exact"""
+    if pd.api.types.is_bool_dtype(series) or not pd.api.types.is_numeric_dtype(series):
+        return series
+    if pd.api.types.is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if series.dtype == np.float64:
+        values = series.to_numpy()
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed, values, equal_nan=True):
+            return pd.Series(narrowed, index=series.index, name=series.name)
+    return series
+
+
+def low_cardinality(distinct, rows):
+    """True if a text column with this many distinct values is worth storing as a categorical"""
+    return distinct <= min(CATEGORY_MAX_RATIO * rows, CATEGORY_MAX_DISTINCT)
+
+
+def estimated_distinct(series, sample_rows=CATEGORY_SAMPLE_ROWS):
+    """
+    Distinct values of a column estimated from at most sample_rows random rows, with
+    the first-order jackknife d / (1 - (1 - n/N) f1 / n) (f1: values seen once)
+    """
+    total = len(series)
+    if total > sample_rows:
+        series = series.iloc[np.random.default_rng(CATEGORY_SAMPLE_SEED).choice(total, sample_rows, replace=False)]
+    sample = series.dropna()
+    counts = sample.value_counts(sort=False)
+    seen, n = len(counts), len(sample)
+    if n == 0 or n >= total:
+        return seen
+    singletons = int((counts == 1).sum())
+    if singletons == n:
+        return total
+    return seen / (1 - (1 - n / total) * singletons / n)
+
+
+def optimize_dtypes(df, distinct_counts=None):
+    """
+    Shrink a freshly loaded frame in place: numerics are downcast losslessly and
+    low-cardinality text columns are stored as categoricals (one code per row). Distinct
+    values come from distinct_counts ({column: count}, e.g. the statistics catalog) when
+    given, and are estimated from a bounded sample otherwise.
+    """
+    distinct_counts = distinct_counts or {}
+    for col in df.columns:
+        series = df[col]
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            distinct = distinct_counts.get(col)
+            if len(series) and low_cardinality(estimated_distinct(series) if distinct is None else distinct, len(series)):
+                df[col] = series.astype("category")
+        else:
+            df[col] = downcast_numeric(series)
+    return df
+
+
+def load_csv(content):
+    """Parse uploaded CSV bytes into a memory-optimized DataFrame"""
+    with stage("parse_csv", bytes_read=len(content)) as current:
+        df = optimize_dtypes(pd.read_csv(io.BytesIO(content)))
+        current.rows = len(df)
+    return df
+
+
+def encode_column(series):
+    """
+    Integer labels for a non-numeric column, equal to LabelEncoder on its string values
+    (missing values become the label 'nan'). Categoricals are relabelled from their
+    existing codes, so only the categories are converted to strings.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        labels = np.asarray(series.cat.categories).astype(str)
+        if (codes < 0).any():
+            labels = np.append(labels, "nan")
+            codes = np.where(codes < 0, len(labels) - 1, codes)
+        # Sorted position of each category's string, merging categories that print the same
+        ranks = np.unique(labels, return_inverse=True)[1]
+        return ranks[codes]
+    return pd.factorize(series.to_numpy().astype(str), sort=True)[0]
@@ -1,12 +1,23 @@
 # utils/helpers.py
 import numpy as np
 
+INTERNAL_TABLE_PREFIX = "_"  # tables the app keeps for itself (versions, stats, jobs)
+
 def json_friendly(obj):
-    """Convert NumPy types to native Python types for JSON serialization"""
-    if isinstance(obj, (np.integer, np.int64)):
-        return int(obj)
-    if isinstance(obj, (np.floating, np.float64, np.float32)):
-        return float(obj)
-    if isinstance(obj, (np.ndarray, list, tuple, set)):
+    """Convert NumPy types to native Python types for JSON serialization; arrays are converted in bulk"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, (list, tuple, set)):
         return [json_friendly(v) for v in obj]
     return obj
+
+def quote_identifier(name):
+    """Quote a table or column name for use in SQLite statements"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+def list_user_tables(conn):
+    """Names of the data tables, leaving out SQLite's and the app's own bookkeeping tables"""
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';")
+    return [row[0] for row in cursor.fetchall() if not row[0].startswith(INTERNAL_TABLE_PREFIX)]
@@ -0,0 +1,83 @@
+# utils/hyperloglog.py
+import math
+import numpy as np
+import pandas as pd
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def precision_for_error(error):
+    """Smallest register precision p whose standard error 1.04 / sqrt(2**p) is within error"""
+    if not 0 < error < 1:
+        raise ValueError("error must be between 0 and 1")
+    precision = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(precision, MIN_PRECISION), MAX_PRECISION)
+
+
+def standard_error(precision):
+    """Relative standard error of an estimate made with 2**precision registers"""
+    return 1.04 / math.sqrt(1 << precision)
+
+
+def _bit_length(x):
+    """Vectorized int.bit_length for uint64 arrays"""
+    x = x.copy()
+    length = np.zeros(len(x), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        mask = x >= (np.uint64(1) << np.uint64(shift))
+        length[mask] += shift
+        x[mask] >>= np.uint64(shift)
+    length += (x > 0).astype(np.uint8)
+    return length
+
+
+def hll_registers(values, precision):
+    """Build the HyperLogLog registers for an array or Series of (non-null) values"""
+    registers = np.zeros(1 << precision, dtype=np.uint8)
+    if len(values) == 0:
+        return registers
+
+    if isinstance(values, pd.Series):
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    else:
+        values = np.asarray(values)
+        if values.dtype.kind not in "biufcmM":
+            values = values.astype(object)
+        hashes = pd.util.hash_array(values)
+    remaining_bits = 64 - precision
+    index = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+    remainder = hashes & np.uint64((1 << remaining_bits) - 1)
+    # Position of the leftmost 1-bit in the remaining bits (1-based)
+    rank = (remaining_bits + 1 - _bit_length(remainder).astype(np.int16)).astype(np.uint8)
+
+    np.maximum.at(registers, index, rank)
+    return registers
+
+
+def hll_merge(a, b):
+    """Union of two sketches built with the same precision"""
+    if len(a) != len(b):
+        raise ValueError("Cannot merge sketches with different precision")
+    return np.maximum(a, b)
+
+
+def hll_estimate(registers):
+    """Estimate the number of distinct values represented by the registers"""
+    m = len(registers)
+    if m >= 128:
+        alpha = 0.7213 / (1 + 1.079 / m)
+    else:
+        alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int32)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        # Small range correction (linear counting)
+        estimate = m * math.log(m / zeros)
+    return estimate
+
+
+def approx_distinct(values, error=0.01):
+    """Approximate number of distinct values with the given relative standard error"""
+    return int(round(hll_estimate(hll_registers(values, precision_for_error(error)))))
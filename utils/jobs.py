@@ -0,0 +1,174 @@
+# utils/jobs.py
+import json
+import multiprocessing
+import os
+import queue
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException
+from utils.db import read_connection, write_connection
+from utils.executor import get_process_pool
+from utils.serialization import dumps
+
+JOBS_TABLE = "_jobs"
+JOB_EVENTS_TABLE = "_job_events"
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 2))  # jobs run at once; each may use its own process pool
+PROGRESS_POLL_INTERVAL = 0.2  # seconds between checks for progress from a running job
+
+# The threads only do the bookkeeping; job bodies run in the shared process pool
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def ensure_job_tables(conn):
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {JOBS_TABLE} ("
+        "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+        "progress INTEGER NOT NULL DEFAULT 0, total INTEGER, result TEXT, error TEXT, "
+        "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {JOB_EVENTS_TABLE} ("
+        "job_id TEXT, seq INTEGER, payload TEXT NOT NULL, created_at REAL NOT NULL, "
+        "PRIMARY KEY (job_id, seq)) WITHOUT ROWID"
+    )
+
+
+def recover_jobs():
+    """Jobs that were queued or running when the server stopped can no longer finish"""
+    with write_connection() as conn:
+        ensure_job_tables(conn)
+        conn.execute(
+            f"UPDATE {JOBS_TABLE} SET status = 'interrupted', updated_at = ? WHERE status IN ('queued', 'running')",
+            (time.time(),),
+        )
+
+
+def _update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with write_connection() as conn:
+        conn.execute(f"UPDATE {JOBS_TABLE} SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+
+def _add_event(job_id, payload):
+    with write_connection() as conn:
+        seq = conn.execute(
+            f"SELECT COALESCE(MAX(seq), 0) + 1 FROM {JOB_EVENTS_TABLE} WHERE job_id = ?", (job_id,)
+        ).fetchone()[0]
+        conn.execute(
+            f"INSERT INTO {JOB_EVENTS_TABLE} (job_id, seq, payload, created_at) VALUES (?, ?, ?, ?)",
+            (job_id, seq, dumps(payload).decode(), time.time()),
+        )
+
+
+def _progress_queue():
+    """A queue pool workers can send progress through, served by one shared manager process"""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = multiprocessing.get_context("spawn").Manager()
+        return _manager.Queue()
+
+
+def _job_worker(fn, args, kwargs, updates):
+    """
+    Pool entry point: run a job body, sending its progress calls through `updates`.
+    Returns (status, result or error text); errors are formatted here because an
+    HTTPException does not survive the trip back from the worker.
+    """
+    def progress(done, total, partial=None):
+        updates.put((done, total, partial))
+
+    try:
+        return "completed", fn(*args, progress=progress, **kwargs)
+    except HTTPException as e:
+        return "failed", str(e.detail)
+    except Exception:
+        return "failed", traceback.format_exc(limit=5)
+
+
+def _run_job(job_id, fn, args, kwargs):
+    _update_job(job_id, status="running")
+    try:
+        updates = _progress_queue()
+        future = get_process_pool().submit(_job_worker, fn, args, kwargs, updates)
+        # Record progress as it arrives; partial results are stored as events
+        while True:
+            try:
+                done, total, partial = updates.get(timeout=PROGRESS_POLL_INTERVAL)
+            except queue.Empty:
+                if future.done():
+                    break
+                continue
+            _update_job(job_id, progress=done, total=total)
+            if partial is not None:
+                _add_event(job_id, partial)
+        status, outcome = future.result()
+    except Exception:
+        # The pool or the manager failed, not the job body
+        _update_job(job_id, status="failed", error=traceback.format_exc(limit=5))
+        return
+    if status == "completed":
+        _update_job(job_id, status="completed", result=dumps(outcome).decode())
+    else:
+        _update_job(job_id, status="failed", error=outcome)
+
+
+def submit_job(kind, fn, *args, **kwargs):
+    """
+    Queue fn(*args, progress=..., **kwargs) on the local job workers and return its id.
+    fn runs in a pool worker, so it and its arguments must be picklable (module-level,
+    outside main.py); it reports progress by calling progress(done, total, partial_result).
+    """
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    with write_connection() as conn:
+        ensure_job_tables(conn)
+        conn.execute(
+            f"INSERT INTO {JOBS_TABLE} (id, kind, status, created_at, updated_at) VALUES (?, ?, 'queued', ?, ?)",
+            (job_id, kind, now, now),
+        )
+    _executor.submit(_run_job, job_id, fn, args, kwargs)
+    return job_id
+
+
+def get_job(job_id):
+    """Status and progress of a job (without its result)"""
+    try:
+        with read_connection() as conn:
+            row = conn.execute(
+                f"SELECT id, kind, status, progress, total, error, created_at, updated_at FROM {JOBS_TABLE} WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+    except sqlite3.OperationalError:
+        row = None
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Job not found: {job_id}")
+    return dict(zip(("id", "kind", "status", "progress", "total", "error", "created_at", "updated_at"), row))
+
+
+def get_job_result(job_id, decode=True):
+    """Result of a completed job; decode=False returns the stored JSON text"""
+    job = get_job(job_id)
+    if job["status"] != "completed":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    with read_connection() as conn:
+        result = conn.execute(f"SELECT result FROM {JOBS_TABLE} WHERE id = ?", (job_id,)).fetchone()[0]
+    return json.loads(result) if decode else result
+
+
+def get_job_events(job_id, after=0):
+    """Partial results recorded after sequence number `after`, oldest first"""
+    get_job(job_id)
+    with read_connection() as conn:
+        rows = conn.execute(
+            f"SELECT seq, payload FROM {JOB_EVENTS_TABLE} WHERE job_id = ? AND seq > ? ORDER BY seq",
+            (job_id, after),
+        ).fetchall()
+    return [{"seq": seq, **json.loads(payload)} for seq, payload in rows]
@@ -0,0 +1,310 @@
+# utils/metrics.py
+import contextvars
+import os
+import re
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from fastapi import Request
+from fastapi.responses import PlainTextResponse
+
+TRACE_MEMORY = os.environ.get("METRICS_TRACE_MEMORY") == "1"  # per-stage peak memory via tracemalloc (slow)
+SERVER_TIMING = os.environ.get("SERVER_TIMING") == "1"  # Server-Timing header on every response
+SERVER_TIMING_HEADER = "x-server-timing"  # request header asking for Server-Timing on one response
+DEBUG_PROFILER = os.environ.get("DEBUG_PROFILER") == "1"  # mount POST /debug/profile-next (unauthenticated)
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL = 0.005  # seconds between stack samples
+REQUEST_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+if TRACE_MEMORY and not tracemalloc.is_tracing():
+    tracemalloc.start()
+
+
+class Stage:
+    """Timing of one named step of an analysis, with the rows and bytes it handled"""
+
+    __slots__ = ("name", "seconds", "rows", "bytes_read", "peak_memory_bytes")
+
+    def __init__(self, name, rows=None, bytes_read=None):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = rows
+        self.bytes_read = bytes_read
+        self.peak_memory_bytes = None
+
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+
+
+class MetricsRegistry:
+    """Process-wide totals per stage and per request route, rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}  # name -> [calls, seconds, rows, bytes_read, peak_memory_bytes]
+        self._requests = {}  # (method, route, status) -> [count, seconds, bucket counts]
+
+    def record_stage(self, stage):
+        with self._lock:
+            totals = self._stages.setdefault(stage.name, [0, 0.0, 0, 0, None])
+            totals[0] += 1
+            totals[1] += stage.seconds
+            totals[2] += stage.rows or 0
+            totals[3] += stage.bytes_read or 0
+            if stage.peak_memory_bytes is not None:
+                totals[4] = max(totals[4] or 0, stage.peak_memory_bytes)
+
+    def record_request(self, method, route, status, seconds):
+        with self._lock:
+            totals = self._requests.setdefault((method, route, str(status)), [0, 0.0, [0] * len(REQUEST_BUCKETS)])
+            totals[0] += 1
+            totals[1] += seconds
+            for i, bound in enumerate(REQUEST_BUCKETS):
+                if seconds <= bound:
+                    totals[2][i] += 1
+
+    def render(self):
+        with self._lock:
+            stages = {name: list(totals) for name, totals in self._stages.items()}
+            requests = {key: [count, seconds, list(buckets)] for key, (count, seconds, buckets) in self._requests.items()}
+
+        lines = [
+            "# HELP rbasic_http_request_duration_seconds Time spent handling requests.",
+            "# TYPE rbasic_http_request_duration_seconds histogram",
+        ]
+        for (method, route, status), (count, seconds, buckets) in sorted(requests.items()):
+            labels = f'method="{_escape(method)}",route="{_escape(route)}",status="{status}"'
+            for bound, bucket in zip(REQUEST_BUCKETS, buckets):
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f'rbasic_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {bucket}')
+            lines.append(f"rbasic_http_request_duration_seconds_sum{{{labels}}} {seconds!r}")
+            lines.append(f"rbasic_http_request_duration_seconds_count{{{labels}}} {count}")
+
+        families = [
+            ("rbasic_stage_calls_total", "counter", "Times each analysis stage ran.", 0),
+            ("rbasic_stage_seconds_total", "counter", "Time spent in each analysis stage.", 1),
+            ("rbasic_stage_rows_total", "counter", "Rows processed by each analysis stage.", 2),
+            ("rbasic_stage_bytes_read_total", "counter", "Bytes read by each analysis stage.", 3),
+            ("rbasic_stage_peak_memory_bytes", "gauge", "Largest traced allocation peak of each stage (METRICS_TRACE_MEMORY=1).", 4),
+        ]
+        for metric, kind, help_text, field in families:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            for name, totals in sorted(stages.items()):
+                if totals[field] is not None:
+                    lines.append(f'{metric}{{stage="{_escape(name)}"}} {totals[field]!r}')
+
+        lines += [
+            "# HELP process_max_resident_memory_bytes Peak resident set size of this process.",
+            "# TYPE process_max_resident_memory_bytes gauge",
+            f"process_max_resident_memory_bytes {max_rss_bytes()}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+            self._requests.clear()
+
+
+registry = MetricsRegistry()
+_collected = contextvars.ContextVar("collected_stages", default=None)  # stages of the running request
+_memory = threading.local()  # per-thread stack of [traced memory at entry, peak seen by nested stages]
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def max_rss_bytes():
+    """Peak resident set size of the process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+@contextmanager
+def collect():
+    """Gather the stages that finish inside this block (and in tasks/threads started from it)"""
+    stages = []
+    token = _collected.set(stages)
+    try:
+        yield stages
+    finally:
+        _collected.reset(token)
+
+
+def _memory_enter():
+    stack = getattr(_memory, "stack", None)
+    if stack is None:
+        stack = _memory.stack = []
+    current, peak = tracemalloc.get_traced_memory()
+    if stack:
+        # reset_peak below would hide this peak from the enclosing stage
+        stack[-1][1] = max(stack[-1][1], peak)
+    tracemalloc.reset_peak()
+    stack.append([current, current])
+
+
+def _memory_exit():
+    stack = _memory.stack
+    start, nested_peak = stack.pop()
+    peak = max(nested_peak, tracemalloc.get_traced_memory()[1])
+    if stack:
+        stack[-1][1] = max(stack[-1][1], peak)
+    return peak - start
+
+
+def record(stage):
+    """Add a finished stage to the process totals and to the running request, if any"""
+    registry.record_stage(stage)
+    stages = _collected.get()
+    if stages is not None:
+        stages.append(stage)
+
+
+@contextmanager
+def stage(name, rows=None, bytes_read=None):
+    """
+    Time a step of an analysis. Rows and bytes may be set on the yielded Stage once known:
+
+        with stage("parse_csv", bytes_read=len(content)) as s:
+            df = pd.read_csv(...)
+            s.rows = len(df)
+    """
+    current = Stage(name, rows, bytes_read)
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        _memory_enter()
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - started
+        if tracing:
+            current.peak_memory_bytes = _memory_exit()
+        record(current)
+
+
+def run_collecting(fn, *args):
+    """Worker-process entry point: run fn and return its result with the stages it recorded"""
+    with collect() as stages:
+        result = fn(*args)
+    return result, stages
+
+
+def server_timing(stages, total_seconds):
+    """Server-Timing header value: per-stage durations summed by name, plus the whole request"""
+    durations = {}
+    for current in stages:
+        durations[current.name] = durations.get(current.name, 0.0) + current.seconds
+    entries = [f"{re.sub(r'[^A-Za-z0-9_-]', '_', name)};dur={seconds * 1000:.1f}" for name, seconds in durations.items()]
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all busy threads at a fixed interval and counts them in the
+    folded format read by flamegraph.pl and speedscope. Threads parked in a wait are skipped.
+    """
+
+    IDLE_MODULES = ("threading.py", "queue.py", "selectors.py", "concurrent/futures/thread.py")
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_filename.endswith(self.IDLE_MODULES):
+                    continue
+                if ident not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+    def dump(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for folded, count in self.samples.most_common():
+                f.write(f"{folded} {count}\n")
+        return path
+
+
+_profile_armed = threading.Event()
+
+
+def profile_next_request():
+    """Arm the sampling profiler for the next request served by this process"""
+    _profile_armed.set()
+
+
+async def metrics_middleware(request: Request, call_next):
+    """
+    Request timing and status for /metrics, the optional Server-Timing header, and the
+    one-shot sampling profiler armed through POST /debug/profile-next (with DEBUG_PROFILER).
+    """
+    profiler = None
+    if _profile_armed.is_set() and request.url.path != "/debug/profile-next":
+        _profile_armed.clear()
+        profiler = SamplingProfiler().start()
+
+    started = time.perf_counter()
+    with collect() as stages:
+        response = await call_next(request)
+    elapsed = time.perf_counter() - started
+
+    route = request.scope.get("route")
+    registry.record_request(request.method, route.path if route else "unmatched", response.status_code, elapsed)
+    if SERVER_TIMING or request.headers.get(SERVER_TIMING_HEADER):
+        response.headers["Server-Timing"] = server_timing(stages, elapsed)
+    if profiler is not None:
+        profiler.stop()
+        name = re.sub(r"[^A-Za-z0-9_-]+", "_", request.url.path).strip("_") or "root"
+        response.headers["X-Profile-Output"] = profiler.dump(os.path.join(PROFILE_DIR, f"{int(time.time() * 1000)}-{name}.folded"))
+    return response
+
+
+def instrument(app):
+    """Add the metrics middleware, GET /metrics and, with DEBUG_PROFILER, POST /debug/profile-next to a FastAPI app"""
+    app.middleware("http")(metrics_middleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+    if DEBUG_PROFILER:
+        @app.post("/debug/profile-next")
+        def arm_profiler():
+            """Sample the next request and write its folded stacks (flamegraph input) under PROFILE_DIR"""
+            profile_next_request()
+            return {"armed": True, "output_dir": PROFILE_DIR}
+
+    return app
@@ -0,0 +1,142 @@
+# utils/parallel.py
+import multiprocessing
+import os
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+import numpy as np
+from utils.executor import MAX_WORKERS, get_process_pool
+from utils.metrics import record, run_collecting
+
+try:
+    import pyarrow as pa
+except ImportError:  # optional: without pyarrow frames are always profiled in-process
+    pa = None
+
+PARALLEL_MIN_CELLS = int(os.environ.get("PARALLEL_MIN_CELLS", 2_000_000))  # smaller frames are not worth the hand-over
+
+
+def in_worker():
+    """True inside a pool worker, which must not start a pool of its own"""
+    return multiprocessing.parent_process() is not None
+
+
+def worker_count(cells, workers=None):
+    """Processes to fan `cells` values of work out over; 1 means run serially"""
+    workers = MAX_WORKERS if workers is None else workers
+    if workers <= 1 or in_worker() or cells < PARALLEL_MIN_CELLS:
+        return 1
+    return workers
+
+
+def map_ordered(tasks):
+    """
+    Run every (fn, *args) task in the shared process pool and return the results in
+    task order. Stages the workers record are added to the current request's metrics.
+    """
+    pool = get_process_pool()
+    futures = [pool.submit(run_collecting, *task) for task in tasks]
+    results = []
+    for future in futures:
+        result, stages = future.result()
+        for worker_stage in stages:
+            record(worker_stage)
+        results.append(result)
+    return results
+
+
+class SharedFrame:
+    """
+    A DataFrame written once as an Arrow IPC stream into shared memory. Workers map it
+    by name instead of receiving a pickled copy, and get their columns back with the
+    original dtypes. Also holds a shared uint64 array of one value per row for results.
+    """
+
+    def __init__(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.MockOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+
+        self.dtypes = {col: df[col].dtype for col in df.columns}
+        self.rows = len(df)
+        self._frame = shared_memory.SharedMemory(create=True, size=max(sink.size(), 1))
+        self._row_values = shared_memory.SharedMemory(create=True, size=max(self.rows * 8, 1))
+        with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(self._frame.buf)), table.schema) as writer:
+            writer.write_table(table)
+
+    @property
+    def handle(self):
+        """Picklable reference passed to workers"""
+        return self._frame.name, self._row_values.name, self.rows, self.dtypes
+
+    def row_values(self):
+        return np.ndarray((self.rows,), dtype=np.uint64, buffer=self._row_values.buf).copy()
+
+    def close(self):
+        for segment in (self._frame, self._row_values):
+            segment.close()
+            segment.unlink()
+
+
+@contextmanager
+def share_frame(df):
+    """SharedFrame for df, or None when it cannot be shared (no pyarrow, or mixed-type columns)"""
+    if pa is None:
+        yield None
+        return
+    try:
+        shared = SharedFrame(df)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        yield None
+        return
+    try:
+        yield shared
+    finally:
+        shared.close()
+
+
+class AttachedFrame:
+    """What a worker sees of a SharedFrame: .df (selected columns and rows) and .row_values"""
+
+    def __init__(self, df, row_values):
+        self.df = df
+        self.row_values = row_values
+
+
+@contextmanager
+def attach_frame(handle, columns=None, rows=None):
+    """
+    Worker side of a SharedFrame. Yields an AttachedFrame whose df holds the selected
+    columns and row range and whose row_values is a writable view of the shared per-row
+    array. Both are dropped on exit so the segments can be unmapped; keep no other
+    references to them.
+    """
+    frame_name, values_name, row_count, dtypes = handle
+    frame = shared_memory.SharedMemory(name=frame_name)
+    values = shared_memory.SharedMemory(name=values_name)
+    attached = None
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(frame.buf)).read_all()
+        if columns is not None:
+            table = table.select(list(columns))
+        if rows is not None:
+            table = table.slice(rows[0], rows[1] - rows[0])
+        df = table.to_pandas()
+        del table
+        for col in df.columns:
+            if df[col].dtype != dtypes[col]:
+                df[col] = df[col].astype(dtypes[col])
+        attached = AttachedFrame(df, np.ndarray((row_count,), dtype=np.uint64, buffer=values.buf))
+        del df
+        yield attached
+    finally:
+        if attached is not None:
+            attached.df = attached.row_values = None
+        frame.close()
+        values.close()
+
+
+def split_ranges(total, parts):
+    """[start, stop) ranges covering range(total) in at most `parts` near-equal pieces"""
+    bounds = np.linspace(0, total, min(parts, total) + 1).astype(int)
+    return [(int(start), int(stop)) for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start]
@@ -0,0 +1,89 @@
+# utils/sampling.py
+import io
+import json
+import numpy as np
+import pandas as pd
+from utils.frames import optimize_dtypes
+from utils.helpers import quote_identifier
+from utils.metrics import stage
+
+SAMPLE_SEED = 42  # fixed so previews of unchanged data are reproducible and cacheable
+CSV_CHUNK_ROWS = 100_000  # rows parsed at a time while sampling a CSV
+
+
+def sample_positions(total, size, seed=SAMPLE_SEED):
+    """Sorted positions of a uniform sample of `size` out of range(total), without replacement"""
+    if size >= total:
+        return np.arange(total)
+    return np.sort(np.random.default_rng(seed).choice(total, size, replace=False))
+
+
+def sample_frame(df, size, stratify=None, seed=SAMPLE_SEED):
+    """
+    Uniform sample of df's rows in their original order. With stratify, every value of
+    that column (nulls included) gets a share proportional to its frequency but at least
+    one row, so rare groups are represented; such a sample is not uniform.
+    """
+    if size >= len(df):
+        return df
+    if stratify is None:
+        return df.iloc[sample_positions(len(df), size, seed)]
+
+    codes = pd.factorize(df[stratify], use_na_sentinel=False)[0]
+    counts = np.bincount(codes)
+    quota = np.maximum(1, np.round(size * counts / len(df))).astype(int)
+    # Random order within each group, then the first `quota` rows of every group
+    order = np.lexsort((np.random.default_rng(seed).random(len(df)), codes))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    rank = np.arange(len(df)) - starts[codes[order]]
+    return df.iloc[np.sort(order[rank < quota[codes[order]]])]
+
+
+def reservoir_sample_csv(content, size, seed=SAMPLE_SEED):
+    """
+    Uniform sample of `size` rows of raw CSV bytes in one streaming pass: every row gets
+    a random key and the rows with the smallest keys are kept, so only one chunk plus
+    the reservoir is ever in memory. Returns (sample, total rows).
+    """
+    rng = np.random.default_rng(seed)
+    kept, keys, total = None, None, 0
+    with stage("sample", bytes_read=len(content)) as current:
+        for chunk in pd.read_csv(io.BytesIO(content), chunksize=CSV_CHUNK_ROWS):
+            chunk.index = pd.RangeIndex(total, total + len(chunk))
+            total += len(chunk)
+            chunk_keys = rng.random(len(chunk))
+            if kept is not None:
+                chunk, chunk_keys = pd.concat([kept, chunk]), np.concatenate([keys, chunk_keys])
+            if len(chunk) > size:
+                smallest = np.argpartition(chunk_keys, size)[:size]
+                chunk, chunk_keys = chunk.iloc[smallest], chunk_keys[smallest]
+            kept, keys = chunk, chunk_keys
+        if kept is None:
+            kept = pd.read_csv(io.BytesIO(content))
+        current.rows = len(kept)
+    return kept.sort_index().reset_index(drop=True), total
+
+
+def sample_table(conn, table_name, size, seed=SAMPLE_SEED):
+    """
+    Uniform sample of a stored table fetched by random rowid, i.e. `size` index lookups
+    instead of a scan. Returns (sample, estimated rows): the row count is the largest
+    rowid scaled by the share of drawn rowids that exist, exact for tables that are
+    only ever appended to.
+    """
+    table = quote_identifier(table_name)
+    max_rowid = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    with stage("sample") as current:
+        if size >= max_rowid:
+            sample = pd.read_sql_query(f"SELECT * FROM {table}", conn)
+            rows = len(sample)
+        else:
+            rowids = sample_positions(max_rowid, size, seed) + 1
+            sample = pd.read_sql_query(
+                f"SELECT * FROM {table} WHERE rowid IN (SELECT value FROM json_each(?)) ORDER BY rowid",
+                conn,
+                params=[json.dumps(rowids.tolist())],
+            )
+            rows = int(round(max_rowid * len(sample) / size))
+        current.rows = len(sample)
+    return optimize_dtypes(sample), rows
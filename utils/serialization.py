@@ -0,0 +1,61 @@
+# utils/serialization.py
+import json
+import math
+import numpy as np
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # optional: without orjson responses are encoded with the standard json module
+    orjson = None
+
+if orjson is not None:
+    ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Values neither encoder handles natively: NumPy/pandas containers in bulk, timestamps as ISO strings"""
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "tolist"):  # ndarray, Series, Index, Categorical
+        return obj.tolist()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _finite(obj):
+    """Copy of a result with NaN and infinity as None, as orjson writes them; the stdlib fallback only"""
+    if isinstance(obj, dict):
+        return {key: _finite(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(value) for value in obj]
+    if isinstance(obj, (float, np.floating)):
+        return float(obj) if math.isfinite(obj) else None
+    if isinstance(obj, (np.ndarray, np.generic)) or hasattr(obj, "tolist"):
+        return _finite(_default(obj))
+    return obj
+
+
+def dumps(obj):
+    """
+    Encode a result to JSON bytes in one pass. NumPy arrays and scalars are written
+    natively; NaN and infinity become null, as JSON has no literal for them.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+    return json.dumps(_finite(obj), default=_default, separators=(",", ":"), allow_nan=False).encode()
+
+
+class FastJSONResponse(Response):
+    """
+    JSON response that encodes its content once with dumps(). Return it from an endpoint
+    to skip FastAPI's jsonable_encoder walk over the result.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content):
+        return dumps(content)